@@ -0,0 +1,263 @@
+import os
+import random
+from io import BytesIO
+from PIL import Image, ImageDraw, ImageFont
+
+from GoFishState import CountState, NUM_RANKS
+
+# Card values and suits named the way deckofcardsapi.com names them, values in rank order
+VALUES = ["2", "3", "4", "5", "6", "7", "8", "9", "10", "JACK", "QUEEN", "KING", "ACE"]
+SUITS = ["SPADES", "DIAMONDS", "CLUBS", "HEARTS"]
+RED_SUITS = ("DIAMONDS", "HEARTS")
+
+# Optional folder of face images named by card code (AS.png, 0H.png, ...), faces without one are drawn
+CARD_IMAGE_DIR = "cards"
+CARD_SIZE = (226, 314)  # Same size as the deckofcardsapi.com pngs
+CARD_BACK_PATH = "card_back.png"
+
+# Composited hands, cards are drawn at HAND_CARD_WIDTH and the app scales the whole image down
+CARDS_PER_ROW = 7
+HAND_CARD_WIDTH = 200
+HAND_GAP = 30
+
+# Card code -> png bytes, every face is read or drawn once per process
+card_images = {}
+
+# (card code or None for the back, width) -> resized RGBA image for composited hands
+hand_cards = {}
+
+
+# Two character code like deckofcardsapi.com uses, 10 is "0"
+def card_code(value, suit):
+    return ("0" if value == "10" else value[0]) + suit[0]
+
+
+# Env rank of a card, 0 for 2s up to 12 for aces
+def card_rank(card):
+    return VALUES.index(card["value"])
+
+
+# Sort key that shows a hand in rank order, then by suit
+def card_sort_key(code):
+    value = next(value for value in VALUES if card_code(value, "S")[0] == code[0])
+    return VALUES.index(value), [suit[0] for suit in SUITS].index(code[1])
+
+
+# Suit pip centered on (x, y), r is half its height
+def draw_suit(draw, suit, x, y, r, fill):
+    if suit == "DIAMONDS":
+        draw.polygon([(x, y - r), (x + 0.75 * r, y), (x, y + r), (x - 0.75 * r, y)], fill=fill)
+    elif suit == "HEARTS":
+        for cx in (x - r / 2, x + r / 2):
+            draw.ellipse([cx - r / 2, y - r, cx + r / 2, y], fill=fill)
+        draw.polygon([(x - r, y - r / 2), (x + r, y - r / 2), (x, y + r)], fill=fill)
+    elif suit == "SPADES":
+        for cx in (x - r / 2, x + r / 2):
+            draw.ellipse([cx - r / 2, y - r / 4, cx + r / 2, y + 3 * r / 4], fill=fill)
+        draw.polygon([(x - r, y + r / 4), (x + r, y + r / 4), (x, y - r)], fill=fill)
+        draw.polygon([(x, y + r / 4), (x - r / 3, y + r), (x + r / 3, y + r)], fill=fill)
+    else:
+        for cx, cy in ((x, y - r / 2), (x - r / 2, y + r / 6), (x + r / 2, y + r / 6)):
+            draw.ellipse([cx - 0.5 * r, cy - 0.5 * r, cx + 0.5 * r, cy + 0.5 * r], fill=fill)
+        draw.polygon([(x, y), (x - r / 3, y + r), (x + r / 3, y + r)], fill=fill)
+
+
+# Plain face for a card, rank and suit in the corners and a large pip in the middle
+def render_card(value, suit):
+    width, height = CARD_SIZE
+    image = Image.new("RGB", CARD_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle([0, 0, width - 1, height - 1], radius=14, outline=(60, 60, 60), width=3)
+
+    color = (200, 30, 30) if suit in RED_SUITS else (20, 20, 20)
+    label = value if value == "10" else value[0]
+    draw.text((14, 10), label, fill=color, font=ImageFont.load_default(size=40))
+    draw_suit(draw, suit, 30, 80, 14, color)
+    draw_suit(draw, suit, width // 2, height // 2, 48, color)
+
+    # Bottom right corner is the top left one turned upside down
+    corner = image.crop((4, 4, 64, 104)).rotate(180)
+    image.paste(corner, (width - 64, height - 104))
+    return image
+
+
+# Png bytes for a card face, from CARD_IMAGE_DIR when it has one
+def card_image(code):
+    if code not in card_images:
+        path = os.path.join(CARD_IMAGE_DIR, code + ".png")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                card_images[code] = f.read()
+        else:
+            value_index, suit_index = card_sort_key(code)
+            buffer = BytesIO()
+            render_card(VALUES[value_index], SUITS[suit_index]).save(buffer, format="PNG")
+            card_images[code] = buffer.getvalue()
+    return card_images[code]
+
+
+def hand_card(code, width):
+    if (code, width) not in hand_cards:
+        source = CARD_BACK_PATH if code is None else BytesIO(card_image(code))
+        height = round(width * CARD_SIZE[1] / CARD_SIZE[0])
+        hand_cards[(code, width)] = Image.open(source).convert("RGBA").resize((width, height), Image.LANCZOS)
+    return hand_cards[(code, width)]
+
+
+# Jpeg bytes of a single card at card_width, None for the back, small enough to inline in html
+def card_jpeg(code, card_width=HAND_CARD_WIDTH, quality=85):
+    buffer = BytesIO()
+    hand_card(code, card_width).convert("RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# Whole hand as a single png, rows of per_row cards with each row centered
+# codes are the cards in display order, None for a card shown face down
+def compose_hand(codes, per_row=CARDS_PER_ROW, card_width=HAND_CARD_WIDTH, gap=HAND_GAP):
+    card_height = round(card_width * CARD_SIZE[1] / CARD_SIZE[0])
+    rows = max(1, (len(codes) + per_row - 1) // per_row)
+    hand = Image.new("RGBA", (per_row * (card_width + gap) - gap, rows * (card_height + gap) - gap))
+
+    for i, code in enumerate(codes):
+        row, col = divmod(i, per_row)
+        in_row = min(per_row, len(codes) - row * per_row)
+        x = (per_row - in_row) * (card_width + gap) // 2 + col * (card_width + gap)
+        hand.alpha_composite(hand_card(code, card_width), (x, row * (card_height + gap)))
+
+    buffer = BytesIO()
+    hand.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# Deck providers return a shuffled 52 card deck as a list of dicts with
+#   code, value, suit and image (anything st.image can show)
+# Name -> provider class, filled in by register_deck_provider
+DECK_PROVIDERS = {}
+
+
+def register_deck_provider(name):
+    def register(cls):
+        DECK_PROVIDERS[name] = cls
+        return cls
+    return register
+
+
+# Deck provider from a registered name, provider objects pass through unchanged
+def make_deck_provider(provider="local", **kwargs):
+    if isinstance(provider, str):
+        if provider not in DECK_PROVIDERS:
+            raise ValueError(f"Unknown deck provider: {provider}")
+        return DECK_PROVIDERS[provider](**kwargs)
+    return provider
+
+
+# Shuffles locally, the same seed always gives the same deck
+# Images are png bytes from the in-memory card_images cache, so nothing goes over the network
+@register_deck_provider("local")
+class LocalDeck:
+    def new_deck(self, seed=None):
+        deck = [{"code": card_code(value, suit), "value": value, "suit": suit,
+                 "image": card_image(card_code(value, suit))}
+                for suit in SUITS for value in VALUES]
+        random.Random(seed).shuffle(deck)
+        return deck
+
+
+# Shuffled and drawn by deckofcardsapi.com, images are urls on their site
+# The site does its own shuffling, so the seed is ignored
+@register_deck_provider("remote")
+class RemoteDeck:
+    def __init__(self, url="https://deckofcardsapi.com/api/deck", timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def new_deck(self, seed=None):
+        import requests
+
+        response = requests.get(f"{self.url}/new/shuffle/?deck_count=1", timeout=self.timeout).json()
+        draw_url = f"{self.url}/{response['deck_id']}/draw/?count=52"
+        return requests.get(draw_url, timeout=self.timeout).json()['cards']
+
+
+# Count state that also keeps the card objects behind every count, so the app and the env
+# share one model of the game, pass it to GoFishEnv as the backend
+# cards[player][rank] holds the cards in hands[player, rank] and set_cards[player][rank] a completed set,
+# the env's rank deck decides which rank gets drawn and the card comes off deck_cards[rank]
+# Draws, asks and set removal move cards in O(cards moved), the same calls that update the counts
+class CardState(CountState):
+    def __init__(self, deck):
+        super().__init__()
+        self.deck = list(deck)
+        self.clear()
+
+    def clear(self):
+        super().clear()
+        self.cards = [[[] for _ in range(NUM_RANKS)] for _ in range(2)]
+        self.set_cards = [[[] for _ in range(NUM_RANKS)] for _ in range(2)]
+        self.deck_cards = [[] for _ in range(NUM_RANKS)]
+        for card in reversed(self.deck):
+            self.deck_cards[card_rank(card)].append(card)
+
+        # (player, card) for every card drawn from the deck, in order, the deal is the first 14
+        self.draws = []
+
+    def add(self, player, rank):
+        super().add(player, rank)
+        card = self.deck_cards[rank].pop()
+        self.cards[player][rank].append(card)
+        self.draws.append((player, card))
+
+    # Removed cards go back to the deck
+    def remove(self, player, rank, n=1):
+        super().remove(player, rank, n)
+        for _ in range(n):
+            self.deck_cards[rank].append(self.cards[player][rank].pop())
+
+    def ask(self, player, rank):
+        moved = super().ask(player, rank)
+        if moved:
+            self.cards[player][rank] += self.cards[1 - player][rank]
+            self.cards[1 - player][rank] = []
+        return moved
+
+    def update_sets(self):
+        before = list(self.sets_mask)
+        super().update_sets()
+        for player in range(2):
+            completed = self.sets_mask[player] & ~before[player]
+            for rank in range(NUM_RANKS):
+                if (completed >> rank) & 1:
+                    self.set_cards[player][rank] = self.cards[player][rank]
+                    self.cards[player][rank] = []
+
+    # Hands and sets replaced wholesale (reset, set_state) only reassign the cards that changed
+    def set_hand(self, player, ranks):
+        super().set_hand(player, ranks)
+        self.sync_cards()
+
+    def set_sets(self, player, sets):
+        super().set_sets(player, sets)
+        self.sync_cards()
+
+    def load(self, record):
+        super().load(record)
+        self.sync_cards()
+
+    # Move cards between the deck, hands and sets until every pile matches the counts
+    def sync_cards(self):
+        piles = []
+        for player in range(2):
+            for rank in range(NUM_RANKS):
+                piles.append((self.cards[player][rank], rank, int(self.hands[player, rank])))
+                piles.append((self.set_cards[player][rank], rank, 4 * ((self.sets_mask[player] >> rank) & 1)))
+
+        for pile, rank, count in piles:
+            while len(pile) > count:
+                self.deck_cards[rank].append(pile.pop())
+        for pile, rank, count in piles:
+            while len(pile) < count:
+                pile.append(self.deck_cards[rank].pop())
+
+    # A player's cards in rank order
+    def hand_cards(self, player):
+        return [card for rank_cards in self.cards[player] for card in rank_cards]
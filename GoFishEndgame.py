@@ -0,0 +1,142 @@
+import itertools
+import os
+import numpy as np
+
+from GoFishState import NUM_RANKS
+
+ENDGAME_TABLE_PATH = "GoFish_endgame.npy"
+
+# Table layout, table[VALUE][key] and table[MOVE][key]
+VALUE = 0
+MOVE = 1
+NO_MOVE = -1
+
+# Each key slot counts live ranks, so it runs from 0 to 13
+SIDE = NUM_RANKS + 1
+
+
+# Once the deck is empty every card of a live rank is in one of the two hands, so the
+# other hand is the complement of the mover's and ranks are interchangeable
+# A position is then just how many live ranks the mover holds 0, 1, 2, 3 or all 4 of
+# (a drawn fourth card isn't turned into a set until the next ask)
+def position_key(counts):
+    key = [0] * 5
+    for count in counts:
+        key[count] += 1
+    return tuple(key)
+
+
+# Same position from the other player's side
+def flip_key(key):
+    return key[::-1]
+
+
+# Best set margin over the live ranks for the player to move, and how many of
+# the asked rank they should hold, memoized in a transposition table
+def solve(key, memo):
+    if key in memo:
+        return memo[key]
+
+    if sum(key) == 0:
+        result = (0, NO_MOVE)
+
+    elif key[0] == sum(key):
+        # Empty hand and no deck, the turn passes
+        result = (-solve(flip_key(key), memo)[0], NO_MOVE)
+
+    else:
+        result = None
+        # Every ask clears the ranks one hand holds all 4 of
+        cleared = key[4] - key[0]
+        for count in range(1, 5):
+            if not key[count]:
+                continue
+
+            rest = [0, key[1], key[2], key[3], 0]
+            if count < 4:
+                # The other hand holds the rest of the rank, the ask completes a set and goes again
+                rest[count] -= 1
+                value = cleared + 1 + solve(tuple(rest), memo)[0]
+            else:
+                # The other hand has none and the turn passes
+                value = cleared - solve(flip_key(tuple(rest)), memo)[0]
+
+            if result is None or value > result[0]:
+                result = (value, count)
+
+    memo[key] = result
+    return result
+
+
+# Dense table over every position key, small enough to solve outright
+def build_table():
+    table = np.full((2,) + (SIDE,) * 5, NO_MOVE, dtype=np.int8)
+    memo = {}
+    for key in itertools.product(range(SIDE), repeat=5):
+        if sum(key) <= NUM_RANKS:
+            value, move = solve(key, memo)
+            table[(VALUE,) + key] = value
+            table[(MOVE,) + key] = move
+    return table
+
+
+def save_table(table, path=ENDGAME_TABLE_PATH):
+    # Write then rename so a reader never sees half a file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, table)
+    os.replace(tmp_path, path)
+
+
+def load_table(path=ENDGAME_TABLE_PATH):
+    return np.load(path, mmap_mode="r")
+
+
+# Perfect play once the deck runs out, every lookup is a single table read
+class EndgameSolver:
+    def __init__(self, path=ENDGAME_TABLE_PATH):
+        if path is not None and os.path.exists(path):
+            self.table = load_table(path)
+        else:
+            self.table = build_table()
+            if path is not None:
+                try:
+                    save_table(self.table, path)
+                except OSError:
+                    # Read only install, keep the table in memory
+                    pass
+
+    # Mover's count for each live rank, None if the position isn't an endgame
+    def _live_counts(self, env, player):
+        if env.deck:
+            return None
+
+        own = env._hand_counts(player)
+        other = env._hand_counts("opponent" if player == "agent" else "agent")
+        live = {}
+        for rank in range(NUM_RANKS):
+            if env.agent_sets[rank] or env.opponent_sets[rank]:
+                continue
+            if own[rank] + other[rank] != 4:
+                return None
+            live[rank] = own[rank]
+        return live
+
+    # Final set margin for player with perfect play from here, None outside the endgame
+    def value(self, env, player="agent"):
+        live = self._live_counts(env, player)
+        if live is None:
+            return None
+        margin = env._sets_completed(player) - env._sets_completed("opponent" if player == "agent" else "agent")
+        return margin + int(self.table[(VALUE,) + position_key(live.values())])
+
+    # Optimal rank for player to ask for, None outside the endgame or with nothing to ask
+    def best_ask(self, env, player="agent"):
+        live = self._live_counts(env, player)
+        if live is None:
+            return None
+        move = int(self.table[(MOVE,) + position_key(live.values())])
+        for rank, count in live.items():
+            if count == move:
+                return rank
+        return None
@@ -1,17 +1,87 @@
 import gymnasium as gym 
 from gymnasium import spaces
-from gymnasium.spaces.utils import flatten
+from gymnasium.spaces.utils import flatdim, flatten, flatten_space
 import numpy as np
-import random
+from GoFishState import CountState, HandView, AGENT, OPPONENT, FAIL_MEMORY, STATE_DTYPE
+from GoFishOpponents import EnvGames, make_opponent
+
+
+# Bump whenever a change to the rules, rewards or training opponents changes how games play out,
+# results cached against an older version (see tournament.py) are then played again
+ENV_VERSION = 1
+
+
+# Start index of each observation field inside the flattened observation,
+# in the same order gymnasium's flatten() lays them out
+def flat_offsets(observation_space):
+    offsets = {}
+    start = 0
+    for key, space in observation_space.spaces.items():
+        offsets[key] = start
+        start += flatdim(space)
+    return offsets
+
+
+# Independent integer seeds for n games, spawned from one base seed
+# Game k always gets the same seed, however the games are split across workers
+def spawn_seeds(seed, n):
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in np.random.SeedSequence(seed).spawn(n)]
+
+
+# Model prediction restricted to the ranks allowed by mask (None allows every rank)
+# Sampling draws from rng, so passing an env's np_random makes predictions reproducible
+# For a batch rng can also be a list with one generator per row
+# model is either a stable_baselines3 model or anything with a logits(obs) method, like NumpyPolicy
+def masked_predict(model, obs, mask=None, deterministic=False, rng=None):
+    if hasattr(model, "logits"):
+        logits = model.logits(obs)
+        vectorized = np.ndim(obs) > 1
+    else:
+        # Only pulled in when a torch model is actually used
+        import torch
+
+        with torch.no_grad():
+            obs_tensor, vectorized = model.policy.obs_to_tensor(obs)
+            logits = model.policy.get_distribution(obs_tensor).distribution.logits.cpu().numpy()
+
+    if mask is not None:
+        logits = np.where(np.reshape(mask, logits.shape), logits, -np.inf)
+
+    if not deterministic:
+        # Gumbel-max, samples from the masked softmax
+        if isinstance(rng, (list, tuple)):
+            noise = np.stack([row_rng.gumbel(size=logits.shape[1:]) for row_rng in rng])
+        else:
+            rng = rng if rng is not None else np.random
+            noise = rng.gumbel(size=logits.shape)
+        logits = logits + noise
+    action = logits.argmax(axis=-1)
+
+    if not vectorized:
+        action = action[0]
+    return action, None
+
 
 class GoFishEnv(gym.Env):
-    def __init__(self, mode="train"):
+    def __init__(self, mode="train", backend="list", flat_obs=False, opponent="greedy", max_steps=None,
+                 max_stalled_steps=None, info_masks=False):
         # Initialize environment
         super().__init__()
 
         # Initialize human player
         self.mode = mode
 
+        # "list" keeps hands as lists of ranks, "counts" keeps them as 13 slot count arrays
+        # A CountState object is used as the counts backend as is (app.py passes a GoFishCards.CardState)
+        if isinstance(backend, CountState):
+            self.state = backend
+            backend = "counts"
+        elif backend not in ("list", "counts"):
+            raise ValueError(f"Unknown backend: {backend}")
+        else:
+            self.state = CountState() if backend == "counts" else None
+        self.backend = backend
+
         # Change 'who' the model is in the gameplay depending on mode
         self.model_role = "agent" if mode == "train" else "opponent"
 
@@ -36,6 +106,21 @@ class GoFishEnv(gym.Env):
             "last_opponent_ask_success": spaces.Discrete(2)
             })
 
+        # Flat mode writes the flattened one-hot observation into a reused buffer,
+        # same layout as FlattenObservation so trained models work unchanged
+        # The returned array is overwritten on the next step, copy it to keep it
+        self.flat_obs = flat_obs
+        self.dict_observation_space = self.observation_space
+        if flat_obs:
+            self.observation_space = flatten_space(self.dict_observation_space)
+            self.flat_offsets = flat_offsets(self.dict_observation_space)
+            self.hand_slots = self.flat_offsets["agent_hand_ranks"] + 5 * np.arange(13)
+            self.obs_buffer = np.zeros(self.observation_space.shape, dtype=self.observation_space.dtype)
+            self.opponent_obs_buffer = np.zeros_like(self.obs_buffer)
+
+        # Reused record for get_state
+        self._state_record = np.zeros((), dtype=STATE_DTYPE)
+
         # Define game environment
         self.deck = self._init_deck()
         self.agent_hand = []
@@ -50,16 +135,49 @@ class GoFishEnv(gym.Env):
         self.last_opponent_ask = 13
         self.last_opponent_ask_success = 0
 
+        # Public events in play mode, ("ask", player, rank, cards_moved) and ("draw", player)
+        # Search agents use this to work out what the other hand could hold
+        self.history = []
+
+        # Optional exact solver the opponent switches to once the deck is empty
+        self.endgame_solver = None
+
+        # Training opponent, a name registered in GoFishOpponents or an opponent object
+        # It acts on batches of games, so the env presents itself as a batch of one
+        self.opponent = make_opponent(opponent)
+        self.games = EnvGames(self)
+        self.game_index = np.zeros(1, dtype=np.intp)
+
+        # Truncation, None turns a check off
+        # max_steps caps the steps in a game, max_stalled_steps ends games where the agent went that many
+        # steps in a row without completing a set or gaining a card (stuck on invalid asks, say)
+        # The opponent's moves don't count, they'd otherwise keep a stuck game going until the deck runs out
+        self.max_steps = max_steps
+        self.max_stalled_steps = max_stalled_steps
+        self.step_count = 0
+        self.stalled_steps = 0
+        self.progress = None
+
+        # info_masks puts action_masks() in the info of every reset and step, off by default
+        # since MaskablePPO and masked_predict ask for the mask themselves
+        self.info_masks = info_masks
+
         
     def reset(self, seed=None, options=None):
         # Reset game to default environment
         
+        # Seeds self.np_random, every random draw in the game comes from it
+        super().reset(seed=seed)
+        if hasattr(self.opponent, "reset_games"):
+            self.games.clear()
+            self.opponent.reset_games(self.games, self.game_index)
+
         # Shuffle deck
         self.deck = self._init_deck()
-        random.shuffle(self.deck)
+        self.np_random.shuffle(self.deck)
 
         # Determine who goes first with coin flip
-        coin_flip = random.randint(0, 1)
+        coin_flip = int(self.np_random.integers(0, 2))
         first = 0
         if coin_flip == 1:
             first = 1
@@ -70,6 +188,8 @@ class GoFishEnv(gym.Env):
 
             
         # Reset agent and oppponent hands
+        if self.state is not None:
+            self.state.clear()
         self.agent_hand = []
         self.opponent_hand = []
 
@@ -100,19 +220,127 @@ class GoFishEnv(gym.Env):
         self.last_agent_ask_success = 0
         self.last_opponent_ask = 13
         self.last_opponent_ask_success = 0
+        self.history = []
+
+        self.step_count = 0
+        self.stalled_steps = 0
+        self.progress = self._progress_marker()
 
         # Set initial observations
         obs = self._get_observation()
-        return obs, {}
+        return obs, {"action_mask": self.action_masks()} if self.info_masks else {}
+
+    # Snapshot of the whole game as a fixed size bytes record, see STATE_DTYPE
+    # Bytes are hashable, so snapshots can key a transposition table
+    # Hands are stored as counts, so list hands come back sorted
+    def get_state(self):
+        if self.progress is None:
+            raise RuntimeError("No game to snapshot, call reset() before get_state()")
+        record = self._state_record
+        record["deck"] = -1
+        record["deck"][:len(self.deck)] = self.deck
+        record["deck_size"] = len(self.deck)
+
+        if self.state is not None:
+            self.state.save(record)
+        else:
+            record["hands"][AGENT] = self._hand_counts("agent")
+            record["hands"][OPPONENT] = self._hand_counts("opponent")
+            record["sets_mask"] = [
+                sum(1 << rank for rank, done in enumerate(sets) if done)
+                for sets in (self.agent_sets, self.opponent_sets)
+            ]
+
+            # Most recent failures, oldest first
+            fails = sorted((turn, rank) for rank, turns in self.recent_failed_asks.items() for turn in turns)
+            fails = fails[-FAIL_MEMORY:]
+            record["fail_ranks"] = -1
+            record["fail_turns"] = 0
+            record["fail_ranks"][FAIL_MEMORY - len(fails):] = [rank for _, rank in fails]
+            record["fail_turns"][FAIL_MEMORY - len(fails):] = [turn for turn, _ in fails]
+
+        record["agent_turn"] = self.agent_turn
+        record["turn_counter"] = self.turn_counter
+        record["last_ask"] = (self.last_agent_ask, self.last_opponent_ask)
+        record["last_ask_success"] = (self.last_agent_ask_success, self.last_opponent_ask_success)
+        record["step_count"] = self.step_count
+        record["stalled_steps"] = self.stalled_steps
+        record["progress"] = self.progress
+        return record.tobytes()
+
+    # Restore a game saved with get_state
+    def set_state(self, state):
+        record = np.frombuffer(state, dtype=STATE_DTYPE)[0]
+        self.deck = record["deck"][:record["deck_size"]].tolist()
+
+        if self.state is not None:
+            self.state.load(record)
+        else:
+            ranks = np.arange(13)
+            self.agent_hand = np.repeat(ranks, record["hands"][AGENT]).tolist()
+            self.opponent_hand = np.repeat(ranks, record["hands"][OPPONENT]).tolist()
+            agent_mask, opponent_mask = (int(mask) for mask in record["sets_mask"])
+            self.agent_sets = [(agent_mask >> rank) & 1 for rank in range(13)]
+            self.opponent_sets = [(opponent_mask >> rank) & 1 for rank in range(13)]
+
+            self.recent_failed_asks = {}
+            for rank, turn in zip(record["fail_ranks"].tolist(), record["fail_turns"].tolist()):
+                if rank >= 0:
+                    self.recent_failed_asks.setdefault(rank, []).append(turn)
+
+        self.agent_turn = bool(record["agent_turn"])
+        self.turn_counter = int(record["turn_counter"])
+        self.last_agent_ask, self.last_opponent_ask = record["last_ask"].tolist()
+        self.last_agent_ask_success, self.last_opponent_ask_success = record["last_ask_success"].tolist()
+        self.step_count = int(record["step_count"])
+        self.stalled_steps = int(record["stalled_steps"])
+        self.progress = tuple(record["progress"].tolist())
 
     # Step function, function differs depending on mode
     def step(self, action):
         if self.mode == "train":
-            return self.training_step(action)
+            obs, reward, terminated, truncated, info = self.training_step(action)
         elif self.mode == "play":
-            return self.step_play(action)
+            obs, reward, terminated, truncated, info = self.step_play(action)
         else:
             print("This should be unreachable, line 104 of GoFishEnv")
+            return
+
+        if not terminated:
+            reason = self._check_truncation()
+            if reason is not None:
+                truncated = True
+                info["truncation_reason"] = reason
+
+        if self.info_masks:
+            info["action_mask"] = self.action_masks()
+        return obs, reward, terminated, truncated, info
+
+    # Agent's completed sets and hand size, the step made progress if the sets changed or the hand grew
+    def _progress_marker(self):
+        return (self._sets_completed("agent"), len(self.agent_hand))
+
+    # Counts this step, returns "max_steps" or "no_progress" if the game should be cut off
+    def _check_truncation(self):
+        self.step_count += 1
+        progress = self._progress_marker()
+        stalled = progress[0] == self.progress[0] and progress[1] <= self.progress[1]
+        self.stalled_steps = self.stalled_steps + 1 if stalled else 0
+        self.progress = progress
+
+        if self.max_stalled_steps is not None and self.stalled_steps >= self.max_stalled_steps:
+            return "no_progress"
+        if self.max_steps is not None and self.step_count >= self.max_steps:
+            return "max_steps"
+        return None
+
+    # Ranks a player can legally ask for, all ranks if their hand is empty
+    # Used by MaskablePPO during training and by masked_predict at inference
+    def action_masks(self, player="agent"):
+        mask = np.array(self._hand_counts(player)) > 0
+        if not mask.any():
+            mask[:] = True
+        return mask
 
     def step_play(self, action, obs=None):
         if obs is None:
@@ -123,7 +351,9 @@ class GoFishEnv(gym.Env):
                 self.agent_turn = False
                 return self._get_observation(), -0.1, False, False, {"reason": "invalid_action"}
 
+            opp_hand_prev = len(self.opponent_hand)
             success = self._process_ask(action, player="agent")
+            self.history.append(("ask", "agent", int(action), opp_hand_prev - len(self.opponent_hand)))
             self._update_sets()
 
             # track human ask
@@ -141,6 +371,7 @@ class GoFishEnv(gym.Env):
                 # Go fish if unsuccessful ask
                 if self.deck:
                     self.agent_hand.append(self.deck.pop())
+                    self.history.append(("draw", "agent"))
                     reward -= 0.05
                 self.agent_turn = False
 
@@ -165,44 +396,7 @@ class GoFishEnv(gym.Env):
             
             self.agent_turn = False
 
-            # Opponent turn, asks for whatever card it has the most of or a random card
-            while self.opponent_hand and not self._check_game_over():
-
-                # Opponent logic
-                counts = [self.opponent_hand.count(r) for r in range(13)]
-
-                # Ask for whatever card it has the most of if no asks yet
-                if self.last_opponent_ask == 13:
-                    opponent_rank = int(np.argmax(counts))
-
-                else:
-                    # Don't repeat asks unless necessary
-                    if any(rank != self.last_opponent_ask for rank in counts):
-                        non_repeats = [i for i in range(len(counts)) if i != self.last_opponent_ask]
-                        # Either ask for whatever you have the most of left or something random
-                        val = random.uniform(1,2)
-                        if val == 1:
-                            opponent_rank = int(np.argmax(non_repeats))
-                        else:
-                            opponent_rank = random.choice(non_repeats)
-                    else:
-                        opponent_rank = random.choice(counts)
-                    
-                success = self._process_ask(opponent_rank, player="opponent")
-                self._update_sets()
-
-                self.last_opponent_ask = opponent_rank
-                self.last_opponent_ask_success = int(success)
-
-                # Draw additional card if someone runs out of cards during turn
-                self._check_empty_hand()
-                
-
-                if not success:
-                    # Opponent go fish
-                    if self.deck:
-                        self.opponent_hand.append(self.deck.pop(0))
-                    break
+            self._training_opponent_turn()
 
             self.agent_turn = True
             done = self._check_game_over()
@@ -212,7 +406,9 @@ class GoFishEnv(gym.Env):
         self.turn_counter += 1
 
         recent_fail_penalty = 0
-        if action in self.recent_failed_asks:
+        if self.state is not None:
+            recent_fail_penalty = -0.2 * self.state.recent_fails(action, self.turn_counter)
+        elif action in self.recent_failed_asks:
             recent_failures = [turn for turn in self.recent_failed_asks[action] if self.turn_counter - turn <= 5]
 
             if recent_failures:
@@ -221,7 +417,7 @@ class GoFishEnv(gym.Env):
         reward = 0.01
         reward += recent_fail_penalty
             
-        prev_sets = sum(self.agent_sets)
+        prev_sets = self._sets_completed("agent")
         opp_hand_prev = len(self.opponent_hand)
         success = self._process_ask(action, player="agent")
         self._update_sets()
@@ -233,7 +429,7 @@ class GoFishEnv(gym.Env):
         self._check_empty_hand()
 
         # Reward based on how many new cards are receievd and new sets 
-        updated_sets = sum(self.agent_sets)
+        updated_sets = self._sets_completed("agent")
         new_sets = updated_sets - prev_sets
         new_cards = opp_hand_prev - len(self.opponent_hand)
 
@@ -258,12 +454,15 @@ class GoFishEnv(gym.Env):
 
         # Go fish if unsuccessful ask
         if not success:
-            if action not in self.recent_failed_asks:
-                self.recent_failed_asks[action] = []
-            self.recent_failed_asks[action].append(self.turn_counter)
+            if self.state is not None:
+                self.state.record_fail(action, self.turn_counter)
+            else:
+                if action not in self.recent_failed_asks:
+                    self.recent_failed_asks[action] = []
+                self.recent_failed_asks[action].append(self.turn_counter)
 
-            if len(self.recent_failed_asks[action]) > 10:
-                   self.recent_failed_asks[action] = self.recent_failed_asks[action][-10:]
+                if len(self.recent_failed_asks[action]) > 10:
+                       self.recent_failed_asks[action] = self.recent_failed_asks[action][-10:]
                    
             if self.deck:
                 self.agent_hand.append(self.deck.pop())
@@ -271,23 +470,7 @@ class GoFishEnv(gym.Env):
                    
             self.agent_turn=False
 
-        # Opponent turn, asks for whatever card it has the most of 
-        while self.opponent_hand and not self._check_game_over():
-            # opponent_rank = random.choice(list(set(self.opponent_hand)))
-            counts = [self.opponent_hand.count(r) for r in range(13)]
-            opponent_rank = int(np.argmax(counts))
-            success = self._process_ask(opponent_rank, player="opponent")
-            self._update_sets()
-            self._check_empty_hand()
-
-            self.last_opponent_ask = opponent_rank
-            self.last_opponent_ask_success = int(success)
-
-            if not success:
-                # Opponent go fish
-                if self.deck:
-                    self.opponent_hand.append(self.deck.pop(0))
-                break
+        self._training_opponent_turn()
         self.agent_turn = True
 
         done = self._check_game_over()
@@ -303,18 +486,96 @@ class GoFishEnv(gym.Env):
     def _init_deck(self):
         return [rank for rank in range(13) for _ in range(4)]
 
+    # Hand and set storage, backed by plain lists or by the count state
+    @property
+    def agent_hand(self):
+        return HandView(self.state, AGENT) if self.state is not None else self._agent_hand
+
+    @agent_hand.setter
+    def agent_hand(self, hand):
+        if self.state is not None:
+            self.state.set_hand(AGENT, hand)
+        else:
+            self._agent_hand = hand
+
+    @property
+    def opponent_hand(self):
+        return HandView(self.state, OPPONENT) if self.state is not None else self._opponent_hand
+
+    @opponent_hand.setter
+    def opponent_hand(self, hand):
+        if self.state is not None:
+            self.state.set_hand(OPPONENT, hand)
+        else:
+            self._opponent_hand = hand
+
+    @property
+    def agent_sets(self):
+        return self.state.sets_list(AGENT) if self.state is not None else self._agent_sets
+
+    @agent_sets.setter
+    def agent_sets(self, sets):
+        if self.state is not None:
+            self.state.set_sets(AGENT, sets)
+        else:
+            self._agent_sets = sets
+
+    @property
+    def opponent_sets(self):
+        return self.state.sets_list(OPPONENT) if self.state is not None else self._opponent_sets
+
+    @opponent_sets.setter
+    def opponent_sets(self, sets):
+        if self.state is not None:
+            self.state.set_sets(OPPONENT, sets)
+        else:
+            self._opponent_sets = sets
+
+    # Read only for the count backend, failures live in the state's ring buffer
+    @property
+    def recent_failed_asks(self):
+        if self.state is not None:
+            return self.state.fails_dict(self.turn_counter)
+        return self._recent_failed_asks
+
+    @recent_failed_asks.setter
+    def recent_failed_asks(self, fails):
+        self._recent_failed_asks = fails
+
+    # Rank counts for a player's hand as a list
+    def _hand_counts(self, player):
+        if self.state is not None:
+            return self.state.hands[AGENT if player == "agent" else OPPONENT].tolist()
+        hand = self.agent_hand if player == "agent" else self.opponent_hand
+        return [hand.count(rank) for rank in range(13)]
+
+    def _sets_completed(self, player):
+        if self.state is not None:
+            return self.state.set_counts[AGENT if player == "agent" else OPPONENT]
+        return sum(self.agent_sets if player == "agent" else self.opponent_sets)
+
     # Get observation helper function, 5 observations
     def _get_observation(self):
         
         # Hand vector to count ranks in hand
-        hand_vector = [self.agent_hand.count(rank) for rank in range(13)]
+        if self.state is not None:
+            hand_vector = self.state.hands[AGENT].copy()
+        else:
+            hand_vector = [self.agent_hand.count(rank) for rank in range(13)]
+
+        if self.flat_obs:
+            return self._write_flat_observation(
+                self.obs_buffer, hand_vector, len(self.opponent_hand),
+                self._sets_completed("agent"), self._sets_completed("opponent"), int(self.agent_turn),
+                self.last_agent_ask, self.last_agent_ask_success,
+                self.last_opponent_ask, self.last_opponent_ask_success)
 
         # Assign hand vector to hand_ranks
         obs = {
             "agent_hand_ranks": hand_vector,
             "opponent_hand_size": len(self.opponent_hand),
-            "agent_sets_completed": sum(self.agent_sets),
-            "opponent_sets_completed": sum(self.opponent_sets),
+            "agent_sets_completed": self._sets_completed("agent"),
+            "opponent_sets_completed": self._sets_completed("opponent"),
             "is_agent_turn": int(self.agent_turn),
             "last_agent_ask": self.last_agent_ask,
             "last_agent_ask_success": self.last_agent_ask_success,
@@ -324,7 +585,26 @@ class GoFishEnv(gym.Env):
         
         return obs
 
+    # One-hot encode an observation into buf, equal to flatten() of the dict observation
+    def _write_flat_observation(self, buf, hand_vector, opponent_hand_size, sets_completed, opponent_sets_completed,
+                                is_turn, last_ask, last_ask_success, last_opponent_ask, last_opponent_ask_success):
+        off = self.flat_offsets
+        buf.fill(0)
+        buf[self.hand_slots + np.asarray(hand_vector)] = 1
+        buf[off["agent_sets_completed"] + sets_completed] = 1
+        buf[off["is_agent_turn"] + is_turn] = 1
+        buf[off["last_agent_ask"] + last_ask] = 1
+        buf[off["last_agent_ask_success"] + last_ask_success] = 1
+        buf[off["last_opponent_ask"] + last_opponent_ask] = 1
+        buf[off["last_opponent_ask_success"] + last_opponent_ask_success] = 1
+        buf[off["opponent_hand_size"] + opponent_hand_size] = 1
+        buf[off["opponent_sets_completed"] + opponent_sets_completed] = 1
+        return buf
+
     def _can_ask(self, rank, player="agent"):
+        if self.state is not None:
+            return 0 <= rank < 13 and self.state.has(AGENT if player == "agent" else OPPONENT, rank)
+
         if player == "agent":
             # Verify legal moves with True or False
             return rank in self.agent_hand
@@ -334,6 +614,8 @@ class GoFishEnv(gym.Env):
     def _process_ask(self, rank, player):
         # Agent or opponent asks for a rank
         # They either get those cards (True) or draw cards from deck (False)
+        if self.state is not None:
+            return self.state.ask(AGENT if player == "agent" else OPPONENT, rank) > 0
         
         if player == "agent": # Agent Case
             asker = self.agent_hand
@@ -359,35 +641,73 @@ class GoFishEnv(gym.Env):
     # Function to note complete sets 
     def _update_sets(self):
         # Check each index to see if set is complete, remove from hand if yes
+        if self.state is not None:
+            self.state.update_sets()
+            return
+
+        # Runs after every ask, so the lists are read directly instead of through the properties
         for rank in range(13):
-            if self.agent_hand.count(rank) == 4 and self.agent_sets[rank] == 0:
-                self.agent_sets[rank] = 1
-                self.agent_hand = [card for card in self.agent_hand if card != rank]
+            if self._agent_hand.count(rank) == 4 and self._agent_sets[rank] == 0:
+                self._agent_sets[rank] = 1
+                self._agent_hand = [card for card in self._agent_hand if card != rank]
 
         # Repeat for opponent
         for rank in range(13):
-            if self.opponent_hand.count(rank) == 4 and self.opponent_sets[rank] == 0:
-                self.opponent_sets[rank] = 1
-                self.opponent_hand = [card for card in self.opponent_hand if card != rank]
+            if self._opponent_hand.count(rank) == 4 and self._opponent_sets[rank] == 0:
+                self._opponent_sets[rank] = 1
+                self._opponent_hand = [card for card in self._opponent_hand if card != rank]
                 
 
     def _check_game_over(self): # True if all sets have been completed
+        if self.state is not None:
+            return self.state.all_sets_done()
         sets = sum(self.agent_sets) + sum(self.opponent_sets)
         return sets == 13
 
-    # Model assignment
+    # Model assignment, a stable_baselines3 model, a NumpyPolicy or a search agent with act(env)
     def set_model(self, model):
         self.model = model
 
+    def set_opponent(self, opponent, **kwargs):
+        self.opponent = make_opponent(opponent, **kwargs)
+
+    # Training opponent's turn, asks until it fails or runs out of cards
+    def _training_opponent_turn(self):
+        while self.opponent_hand and not self._check_game_over():
+            self.games.clear()
+            opponent_rank = int(self.opponent.act(self.games, self.game_index)[0])
+            success = self._process_ask(opponent_rank, player="opponent")
+            self._update_sets()
+            self._check_empty_hand()
+
+            self.last_opponent_ask = opponent_rank
+            self.last_opponent_ask_success = int(success)
+
+            if not success:
+                # Opponent go fish
+                if self.deck:
+                    self.opponent_hand.append(self.deck.pop(0))
+                break
+
+    def set_endgame_solver(self, solver):
+        self.endgame_solver = solver
+
     def _get_opponent_observation(self):
         # Reverse perspective of observations
-        opponent_hand_vector = [self.opponent_hand.count(rank) for rank in range(13)]
+        opponent_hand_vector = self._hand_counts("opponent")
+
+        if self.flat_obs:
+            return self._write_flat_observation(
+                self.opponent_obs_buffer, opponent_hand_vector, len(self.agent_hand),
+                self._sets_completed("opponent"), self._sets_completed("agent"), 1,
+                self.last_opponent_ask, self.last_opponent_ask_success,
+                self.last_agent_ask, self.last_agent_ask_success)
         
         obs = {
             "agent_hand_ranks": opponent_hand_vector,  # Opponent's hand from their perspective
             "opponent_hand_size": len(self.agent_hand),  # Human player's hand size
-            "agent_sets_completed": sum(self.opponent_sets),  # Opponent's sets
-            "opponent_sets_completed": sum(self.agent_sets),  # Human's sets
+            "agent_sets_completed": self._sets_completed("opponent"),  # Opponent's sets
+            "opponent_sets_completed": self._sets_completed("agent"),  # Human's sets
             "is_agent_turn": 1,  # It's the opponent's turn, so from their perspective it's their turn
             # Previous move memory gets flipped in this case
             "last_agent_ask": self.last_opponent_ask,
@@ -404,6 +724,8 @@ class GoFishEnv(gym.Env):
             if not self.agent_hand:
                 if self.deck:
                     self.agent_hand.append(self.deck.pop())
+                    if self.mode == "play":
+                        self.history.append(("draw", "agent"))
                 else:
                     self.agent_turn = False
 
@@ -411,10 +733,15 @@ class GoFishEnv(gym.Env):
             if not self.opponent_hand:
                 if self.deck:
                     self.opponent_hand.append(self.deck.pop())
+                    if self.mode == "play":
+                        self.history.append(("draw", "opponent"))
                 else:
                     self.agent_turn = True
 
     def _remove_old_fails(self):
+        # Ring buffer overwrites old failures on its own
+        if self.state is not None:
+            return
         for rank in list(self.recent_failed_asks.keys()):
             self.recent_failed_asks[rank] = [
                 turn for turn in self.recent_failed_asks[rank]
@@ -424,15 +751,29 @@ class GoFishEnv(gym.Env):
                 del self.recent_failed_asks[rank]
 
     def play_opponent_turn(self):
-        if hasattr(self, "model") and self.model is not None:
-            opponent_obs = self._get_opponent_observation()
-            flat_obs = flatten(self.observation_space, opponent_obs)
-            action, _ = self.model.predict(flat_obs, deterministic=True)
-        else:
-            valid_asks = [rank for rank in range(13) if rank in self.opponent_hand]
-            action = random.choice(valid_asks) if valid_asks else 0
+        # Endgame positions are looked up, the model only plays while cards are left to draw
+        action = None
+        if self.endgame_solver is not None and not self.deck:
+            action = self.endgame_solver.best_ask(self, "opponent")
+
+        if action is None:
+            # Search agents look at the game itself rather than an observation
+            if getattr(self, "model", None) is not None and hasattr(self.model, "act"):
+                action = self.model.act(self)
+            elif hasattr(self, "model") and self.model is not None:
+                opponent_obs = self._get_opponent_observation()
+                if self.flat_obs:
+                    flat_obs = opponent_obs
+                else:
+                    flat_obs = flatten(self.observation_space, opponent_obs)
+                action, _ = masked_predict(self.model, flat_obs, self.action_masks("opponent"), deterministic=True)
+            else:
+                valid_asks = [rank for rank, count in enumerate(self._hand_counts("opponent")) if count]
+                action = int(self.np_random.choice(valid_asks)) if valid_asks else 0
 
+        agent_hand_prev = len(self.agent_hand)
         success = self._process_ask(action, player="opponent")
+        self.history.append(("ask", "opponent", int(action), agent_hand_prev - len(self.agent_hand)))
         self._update_sets()
         self._check_empty_hand()
 
@@ -441,6 +782,7 @@ class GoFishEnv(gym.Env):
 
         if not success and self.deck:
             self.opponent_hand.append(self.deck.pop())
+            self.history.append(("draw", "opponent"))
 
         if not success:
             self.agent_turn = True
@@ -0,0 +1,195 @@
+import multiprocessing as mp
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+from GoFishState import NUM_RANKS, AGENT, OPPONENT
+from GoFishOpponents import make_opponent, register_opponent
+from GoFishPolicy import mlp_logits
+from GoFishModels import policy_arrays
+
+# Slot value for games that play the fallback opponent, and for games not dealt yet
+FALLBACK = -1
+NO_SLOT = -2
+
+
+# Snapshot pool shared by the learner and the env workers
+# Weights are stored flat, one row per slot, and results are kept per game so every
+# worker only ever writes to its own games
+class LeaguePool:
+    def __init__(self, shapes, num_envs, capacity=16, shared=False):
+        self.shapes = [tuple(shape) for shape in shapes]
+        sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.bounds = np.cumsum([0] + sizes)
+        self.capacity = capacity
+        self.added = 0
+
+        layouts = {
+            "weights": ((capacity, int(self.bounds[-1])), np.float32),
+            "size": ((1,), np.int64),
+            "probs": ((capacity,), np.float64),
+            "slots": ((num_envs,), np.int64),
+            "games": ((num_envs, capacity), np.float64),
+            "wins": ((num_envs, capacity), np.float64),
+        }
+        self.buffers = {}
+        for name, (shape, dtype) in layouts.items():
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            raw = mp.RawArray("b", nbytes) if shared else bytearray(nbytes)
+            self.buffers[name] = (raw, shape, np.dtype(dtype).str)
+        self.block = slice(None)
+        self._build_views()
+        self.slots[:] = NO_SLOT
+
+    def _build_views(self):
+        for name, (raw, shape, dtype) in self.buffers.items():
+            view = np.frombuffer(raw, dtype=dtype).reshape(shape)
+            if name in ("slots", "games", "wins"):
+                view = view[self.block]
+            setattr(self, name, view)
+
+    # Views are rebuilt after pickling, shared buffers stay shared
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.buffers:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_views()
+
+    # Same pool restricted to the games in block, for a worker that renumbers its games from 0
+    def for_block(self, block):
+        pool = object.__new__(LeaguePool)
+        pool.__setstate__(dict(self.__getstate__(), block=block))
+        return pool
+
+    # Weight arrays of one slot, views into the shared row
+    def arrays(self, slot):
+        row = self.weights[slot]
+        return [row[start:stop].reshape(shape) for start, stop, shape in zip(self.bounds[:-1], self.bounds[1:], self.shapes)]
+
+    # Store a snapshot, replacing the oldest once the pool is full
+    def add(self, arrays):
+        slot = self.added % self.capacity
+        self.weights[slot] = np.concatenate([np.ravel(array) for array in arrays])
+        self.games[:, slot] = 0
+        self.wins[:, slot] = 0
+        self.added += 1
+        self.size[0] = min(self.added, self.capacity)
+        return slot
+
+    # Copies of the whole pool, for checkpoints
+    def get_state(self):
+        state = {name: np.frombuffer(raw, dtype=dtype).reshape(shape).copy() for name, (raw, shape, dtype) in self.buffers.items()}
+        state["added"] = self.added
+        return state
+
+    def set_state(self, state):
+        for name, (raw, shape, dtype) in self.buffers.items():
+            np.frombuffer(raw, dtype=dtype).reshape(shape)[...] = state[name]
+        self.added = state["added"]
+
+    # Learner's win rate against every filled slot, ties count half
+    def win_rates(self):
+        size = int(self.size[0])
+        games = self.games[:, :size].sum(axis=0)
+        wins = self.wins[:, :size].sum(axis=0)
+        return (wins + 1) / (games + 2)
+
+    # Prioritized fictitious self-play, snapshots the learner struggles against come up more
+    def update_priorities(self, exponent=2.0):
+        size = int(self.size[0])
+        if not size:
+            return
+        weight = (1 - self.win_rates()) ** exponent + 1e-6
+        self.probs[:size] = weight / weight.sum()
+
+
+# Opponent that deals every game a snapshot from a LeaguePool, or the fallback policy
+# with probability fallback_prob (always while the pool is empty)
+# Games facing the same snapshot are run through it in one batched forward pass
+@register_opponent("league")
+class LeagueOpponent:
+    def __init__(self, pool, fallback="greedy", fallback_prob=0.2, deterministic=False):
+        self.pool = pool
+        self.fallback = make_opponent(fallback)
+        self.fallback_prob = fallback_prob
+        self.deterministic = deterministic
+
+    def for_block(self, block):
+        return LeagueOpponent(self.pool.for_block(block), self.fallback, self.fallback_prob, self.deterministic)
+
+    # Called before games in idx are dealt again, records finished games and picks new opponents
+    def reset_games(self, games, idx):
+        pool = self.pool
+        slots = pool.slots[idx]
+        set_counts = games.set_counts[idx]
+        finished = (slots >= 0) & (set_counts.sum(axis=1) == NUM_RANKS)
+        margin = set_counts[finished, AGENT] - set_counts[finished, OPPONENT]
+        rows = idx[finished]
+        np.add.at(pool.games, (rows, slots[finished]), 1)
+        np.add.at(pool.wins, (rows, slots[finished]), (margin > 0) + 0.5 * (margin == 0))
+
+        size = int(pool.size[0])
+        cumulative = np.cumsum(pool.probs[:size])
+        for game in idx:
+            rng = games.rngs[game]
+            if not size or rng.random() < self.fallback_prob:
+                pool.slots[game] = FALLBACK
+            else:
+                pick = np.searchsorted(cumulative, rng.random() * cumulative[-1], side="right")
+                pool.slots[game] = min(pick, size - 1)
+
+    def act(self, games, idx):
+        slots = self.pool.slots[idx]
+        ranks = np.zeros(len(idx), dtype=np.int64)
+
+        fallback = slots < 0
+        if fallback.any():
+            ranks[fallback] = self.fallback.act(games, idx[fallback])
+
+        snapshot = np.flatnonzero(~fallback)
+        if not snapshot.size:
+            return ranks
+
+        obs = games.opponent_observations(idx[snapshot])
+        masks = games.hands[idx[snapshot], OPPONENT] > 0
+        logits = np.empty(masks.shape, dtype=np.float32)
+        for slot in np.unique(slots[snapshot]):
+            rows = slots[snapshot] == slot
+            logits[rows] = mlp_logits(self.pool.arrays(slot), obs[rows])
+
+        logits = np.where(masks, logits, -np.inf)
+        if not self.deterministic:
+            # Gumbel-max with each game's own rng, samples the masked softmax
+            logits = logits + np.stack([games.rngs[game].gumbel(size=NUM_RANKS) for game in idx[snapshot]])
+        ranks[snapshot] = logits.argmax(axis=1)
+        return ranks
+
+
+# Adds a snapshot of the learning policy every snapshot_every steps and refreshes
+# sampling priorities after each rollout, opponents are picked per game in the env
+class LeagueCallback(BaseCallback):
+    def __init__(self, pool, snapshot_every=50_000, exponent=2.0, verbose=0):
+        super().__init__(verbose)
+        self.pool = pool
+        self.snapshot_every = snapshot_every
+        self.exponent = exponent
+        self.last_snapshot = 0
+
+    def _on_step(self):
+        return True
+
+    def _on_rollout_end(self):
+        if self.num_timesteps - self.last_snapshot >= self.snapshot_every:
+            slot = self.pool.add(policy_arrays(self.model))
+            self.last_snapshot = self.num_timesteps
+            if self.verbose:
+                print(f"League snapshot at {self.num_timesteps} steps in slot {slot}")
+
+        self.pool.update_priorities(self.exponent)
+        size = int(self.pool.size[0])
+        self.logger.record("league/size", size)
+        if size:
+            self.logger.record("league/mean_win_rate", float(self.pool.win_rates().mean()))
@@ -0,0 +1,60 @@
+import json
+import sys
+import zipfile
+
+from GoFishPolicy import NumpyPolicy
+
+# Tiers app.py serves, exported by running this file
+SHIPPED_MODELS = ["GoFish_Model_easy", "GoFish_Model_medium", "GoFish_Model_hard"]
+
+
+# Checkpoints trained with action masks are MaskablePPO, which PPO.load can't rebuild
+def is_maskable_checkpoint(path):
+    path = str(path)
+    if not path.endswith(".zip"):
+        path += ".zip"
+    with zipfile.ZipFile(path) as archive:
+        data = json.loads(archive.read("data"))
+    return data["policy_class"]["__module__"].startswith("sb3_contrib")
+
+
+# Load a saved model with whichever algorithm it was trained with
+# stable_baselines3 pulls in torch, so it's only imported once a full model is needed
+def load_model(path, **kwargs):
+    if is_maskable_checkpoint(path):
+        from sb3_contrib import MaskablePPO
+        return MaskablePPO.load(path, **kwargs)
+    from stable_baselines3 import PPO
+    return PPO.load(path, **kwargs)
+
+
+# Actor weights of a PPO / MaskablePPO MlpPolicy as numpy arrays, in mlp_shapes order
+def policy_arrays(model):
+    from torch import nn
+
+    layers = [layer for layer in model.policy.mlp_extractor.policy_net if isinstance(layer, nn.Linear)]
+    layers.append(model.policy.action_net)
+    arrays = []
+    for layer in layers:
+        arrays.append(layer.weight.detach().cpu().numpy().T)
+        arrays.append(layer.bias.detach().cpu().numpy())
+    return arrays
+
+
+# Write a model's actor (a loaded model or a checkpoint path) as a NumpyPolicy .npz,
+# next to the checkpoint unless path says otherwise
+def export_policy(model, path=None):
+    if isinstance(model, str):
+        if path is None:
+            path = (model[:-4] if model.endswith(".zip") else model) + ".npz"
+        model = load_model(model)
+    policy = NumpyPolicy(policy_arrays(model), model.policy.activation_fn.__name__.lower())
+    policy.save(path)
+    return policy
+
+
+if __name__ == "__main__":
+    # python GoFishModels.py [checkpoint ...], exports the shipped models by default
+    for checkpoint in sys.argv[1:] or SHIPPED_MODELS:
+        export_policy(checkpoint)
+        print(f"Exported {checkpoint}")
@@ -0,0 +1,290 @@
+import numpy as np
+from gymnasium.spaces.utils import flatten
+
+from GoFishState import NUM_RANKS, AGENT, OPPONENT
+from GoFishSearch import SearchAgent
+
+# Training opponents act on a batch of games at once
+# act(games, idx) returns the rank each game in idx asks for, where games has
+#   hands (n, 2, 13), hand_sizes (n, 2), sets (n, 2, 13), set_counts (n, 2),
+#   last_ask (n, 2), last_ask_success (n, 2), fail_ranks / fail_turns (n, FAIL_MEMORY),
+#   turn_counter (n,), rngs (one np.random.Generator per game)
+#   and opponent_observations(idx), the flat observations from the opponent's side
+# GoFishVecEnv is such a batch, EnvGames wraps a single GoFishEnv as a batch of one
+# and SwappedGames turns a GoFishVecEnv around so an opponent policy can play the agent's seat
+# Random choices come from each game's own rng so games stay reproducible per seed
+
+# Name -> opponent class, filled in by register_opponent
+OPPONENTS = {}
+
+
+def register_opponent(name):
+    def register(cls):
+        OPPONENTS[name] = cls
+        return cls
+    return register
+
+
+# Opponent from a registered name, opponent objects pass through unchanged
+def make_opponent(opponent="greedy", **kwargs):
+    if isinstance(opponent, str):
+        if opponent not in OPPONENTS:
+            raise ValueError(f"Unknown opponent: {opponent}")
+        return OPPONENTS[opponent](**kwargs)
+    return opponent
+
+
+# Uniform pick among the True entries of each row of candidates
+def _choose(games, idx, candidates):
+    ranks = np.zeros(len(idx), dtype=np.int64)
+    for j, game in enumerate(idx):
+        options = np.flatnonzero(candidates[j])
+        if options.size:
+            ranks[j] = options[games.rngs[game].integers(options.size)]
+    return ranks
+
+
+@register_opponent("random")
+class RandomOpponent:
+    def act(self, games, idx):
+        return _choose(games, idx, games.hands[idx, OPPONENT] > 0)
+
+
+# Asks for whatever it holds the most of, the env's original training opponent
+@register_opponent("greedy")
+class GreedyOpponent:
+    def act(self, games, idx):
+        return games.hands[idx, OPPONENT].argmax(axis=1)
+
+
+# Greedy first ask, after that avoids repeating its last ask and mixes greedy
+# and random picks, what the invalid action branch of training_step meant to do
+@register_opponent("explore")
+class ExploreOpponent:
+    def __init__(self, greedy_prob=0.5):
+        self.greedy_prob = greedy_prob
+
+    def act(self, games, idx):
+        counts = games.hands[idx, OPPONENT]
+        ranks = counts.argmax(axis=1)
+        last = games.last_ask[idx, OPPONENT]
+
+        for j in np.flatnonzero(last != NUM_RANKS):
+            held = counts[j] > 0
+            held[last[j]] = False
+            # Only the last rank left, ask it again
+            if not held.any():
+                continue
+
+            rng = games.rngs[idx[j]]
+            if rng.random() < self.greedy_prob:
+                ranks[j] = np.where(held, counts[j], -1).argmax()
+            else:
+                options = np.flatnonzero(held)
+                ranks[j] = options[rng.integers(options.size)]
+        return ranks
+
+
+# Remembers the agent's recent failed asks, the agent held those ranks when it asked,
+# and doesn't repeat its own failed ask, otherwise greedy
+@register_opponent("memory")
+class MemoryOpponent:
+    def __init__(self, window=10):
+        self.window = window
+
+    def act(self, games, idx):
+        counts = games.hands[idx, OPPONENT].astype(np.int64)
+        held = counts > 0
+
+        fail_ranks = games.fail_ranks[idx]
+        recent = (fail_ranks >= 0) & (games.turn_counter[idx, None] - games.fail_turns[idx] <= self.window)
+        known = np.zeros(counts.shape, dtype=bool)
+        rows, slots = np.nonzero(recent)
+        known[rows, fail_ranks[rows, slots]] = True
+
+        # The agent had none of our last rank if that ask failed
+        last = games.last_ask[idx, OPPONENT]
+        missed = np.flatnonzero((last != NUM_RANKS) & (games.last_ask_success[idx, OPPONENT] == 0))
+        avoid = np.zeros(counts.shape, dtype=bool)
+        avoid[missed, last[missed]] = True
+        known &= ~avoid
+
+        # Held ranks the agent is known to have first, missed ranks last, most held first within each
+        score = np.where(held, counts + 10 * known - 5 * avoid, -100)
+        return score.argmax(axis=1)
+
+
+# Frozen policy, either a loaded model or a checkpoint path (its exported NumpyPolicy if there is one)
+@register_opponent("ppo")
+class PolicyOpponent:
+    def __init__(self, model, deterministic=True):
+        if isinstance(model, str):
+            from GoFishPolicy import load_policy
+            model = load_policy(model)
+        self.model = model
+        self.deterministic = deterministic
+
+    def act(self, games, idx):
+        from GoFishEnv import masked_predict
+
+        obs = games.opponent_observations(idx)
+        masks = games.hands[idx, OPPONENT] > 0
+        rngs = [games.rngs[game] for game in idx]
+        action, _ = masked_predict(self.model, obs, masks, deterministic=self.deterministic, rng=rngs)
+        return np.asarray(action, dtype=np.int64)
+
+
+# Determinized search, one search per game with a small time budget
+# Batches only carry the last asks, so those are the only constraints on the agent's hand
+@register_opponent("search")
+class SearchOpponent:
+    def __init__(self, time_budget=0.05, num_workers=1, max_worlds=None, seed=None):
+        self.agent = SearchAgent(time_budget, num_workers, max_worlds, seed)
+
+    def act(self, games, idx):
+        ranks = np.zeros(len(idx), dtype=np.int64)
+        for j, game in enumerate(idx):
+            own = games.hands[game, OPPONENT].tolist()
+            done = games.sets[game].any(axis=0)
+            unseen = [0 if done[rank] else 4 - own[rank] for rank in range(NUM_RANKS)]
+            sets = games.set_counts[game].tolist()
+
+            min_counts = [0] * NUM_RANKS
+            known_zero = [False] * NUM_RANKS
+            agent_last, opponent_last = games.last_ask[game].tolist()
+            agent_success, opponent_success = games.last_ask_success[game].tolist()
+            if agent_last != NUM_RANKS and not agent_success:
+                min_counts[agent_last] = 1
+            if opponent_last != NUM_RANKS and not opponent_success:
+                known_zero[opponent_last] = True
+
+            ranks[j] = self.agent.search(own, unseen, int(games.hand_sizes[game, AGENT]), sets, min_counts, known_zero)
+        return ranks
+
+    def close(self):
+        self.agent.close()
+
+
+# A single GoFishEnv seen as a batch of one game
+# The count backend's arrays are used as they are, with the list backend each array is built on first
+# access and kept until clear(), which the env calls before every opponent ask
+class EnvGames:
+    def __init__(self, env):
+        self.env = env
+        self.rows = {}
+
+    def clear(self):
+        self.rows.clear()
+
+    def _row(self, name, build):
+        if name not in self.rows:
+            self.rows[name] = build()
+        return self.rows[name]
+
+    @property
+    def hands(self):
+        if self.env.state is not None:
+            return self.env.state.hands[None]
+        return self._row("hands", lambda: np.array([[
+            np.bincount(np.array(self.env.agent_hand, dtype=np.int64), minlength=NUM_RANKS),
+            np.bincount(np.array(self.env.opponent_hand, dtype=np.int64), minlength=NUM_RANKS)]]))
+
+    @property
+    def hand_sizes(self):
+        return self._row("hand_sizes", lambda: np.array([[len(self.env.agent_hand), len(self.env.opponent_hand)]]))
+
+    @property
+    def sets(self):
+        return self._row("sets", lambda: np.array([[self.env.agent_sets, self.env.opponent_sets]], dtype=bool))
+
+    @property
+    def set_counts(self):
+        return self._row("set_counts", lambda: np.array([[self.env._sets_completed("agent"),
+                                                          self.env._sets_completed("opponent")]]))
+
+    @property
+    def last_ask(self):
+        return self._row("last_ask", lambda: np.array([[self.env.last_agent_ask, self.env.last_opponent_ask]]))
+
+    @property
+    def last_ask_success(self):
+        return self._row("last_ask_success", lambda: np.array([[self.env.last_agent_ask_success,
+                                                                self.env.last_opponent_ask_success]]))
+
+    @property
+    def fail_ranks(self):
+        if self.env.state is not None:
+            return self.env.state.fail_ranks[None].astype(np.int64)
+        return self._row("fail_ranks", lambda: np.array(
+            [[rank for rank, turns in self.env.recent_failed_asks.items() for _ in turns]], dtype=np.int64).reshape(1, -1))
+
+    @property
+    def fail_turns(self):
+        if self.env.state is not None:
+            return self.env.state.fail_turns[None].astype(np.int64)
+        return self._row("fail_turns", lambda: np.array(
+            [[turn for turns in self.env.recent_failed_asks.values() for turn in turns]], dtype=np.int64).reshape(1, -1))
+
+    @property
+    def turn_counter(self):
+        return np.array([self.env.turn_counter])
+
+    @property
+    def rngs(self):
+        return [self.env.np_random]
+
+    def opponent_observations(self, idx):
+        obs = self.env._get_opponent_observation()
+        if not self.env.flat_obs:
+            obs = flatten(self.env.observation_space, obs)
+        return np.asarray(obs)[None]
+
+
+# A GoFishVecEnv seen from the agent's seat, so any opponent policy can pick the agent's asks
+# The env only remembers the agent's failed asks, so the swapped fail memory is empty
+class SwappedGames:
+    def __init__(self, games):
+        self.games = games
+
+    @property
+    def hands(self):
+        return self.games.hands[:, ::-1]
+
+    @property
+    def hand_sizes(self):
+        return self.games.hand_sizes[:, ::-1]
+
+    @property
+    def sets(self):
+        return self.games.sets[:, ::-1]
+
+    @property
+    def set_counts(self):
+        return self.games.set_counts[:, ::-1]
+
+    @property
+    def last_ask(self):
+        return self.games.last_ask[:, ::-1]
+
+    @property
+    def last_ask_success(self):
+        return self.games.last_ask_success[:, ::-1]
+
+    @property
+    def fail_ranks(self):
+        return np.full_like(self.games.fail_ranks, -1)
+
+    @property
+    def fail_turns(self):
+        return np.zeros_like(self.games.fail_turns)
+
+    @property
+    def turn_counter(self):
+        return self.games.turn_counter
+
+    @property
+    def rngs(self):
+        return self.games.rngs
+
+    def opponent_observations(self, idx):
+        return self.games._get_observation(idx)[idx]
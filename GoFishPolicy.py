@@ -0,0 +1,77 @@
+import os
+import numpy as np
+
+from GoFishState import NUM_RANKS
+
+# Hidden layer activations an exported policy can use, by the name torch gives the module
+ACTIVATIONS = {
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+}
+
+
+# (in, out) weight and bias shapes of an MlpPolicy actor, obs -> hidden layers -> logits
+def mlp_shapes(obs_dim, hidden=(64, 64), n_actions=NUM_RANKS):
+    sizes = [obs_dim] + list(hidden) + [n_actions]
+    shapes = []
+    for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+        shapes += [(n_in, n_out), (n_out,)]
+    return shapes
+
+
+# Actor forward pass, tanh hidden layers like the default MlpPolicy
+def mlp_logits(arrays, obs, activation="tanh"):
+    act = ACTIVATIONS[activation]
+    x = np.asarray(obs, dtype=np.float32)
+    for i in range(0, len(arrays) - 2, 2):
+        x = act(x @ arrays[i] + arrays[i + 1])
+    return x @ arrays[-2] + arrays[-1]
+
+
+# Actor of a PPO / MaskablePPO MlpPolicy as plain NumPy arrays, made by GoFishModels.export_policy
+# Works anywhere a loaded model does (set_model, masked_predict, predict) without importing torch
+class NumpyPolicy:
+    def __init__(self, arrays, activation="tanh"):
+        self.arrays = [np.asarray(array, dtype=np.float32) for array in arrays]
+        self.activation = activation
+
+    # Logits for a batch of flat observations, a single observation comes back as a batch of one
+    def logits(self, obs):
+        return mlp_logits(self.arrays, np.atleast_2d(obs), self.activation)
+
+    # Same contract as BaseAlgorithm.predict, the most likely rank when deterministic,
+    # otherwise a sample from the softmax
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        logits = self.logits(observation)
+        if not deterministic:
+            logits = logits + np.random.gumbel(size=logits.shape)
+        action = logits.argmax(axis=1)
+        if np.ndim(observation) == 1:
+            action = action[0]
+        return action, state
+
+    def save(self, path):
+        np.savez(path, *self.arrays, activation=self.activation)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arrays = [data[f"arr_{i}"] for i in range(len(data.files) - 1)]
+            return cls(arrays, str(data["activation"]))
+
+
+# Policy to serve from a checkpoint path, the exported .npz next to it when there is one
+# so no torch gets imported, otherwise the full model
+def load_policy(path):
+    path = policy_path(path)
+    if path.endswith(".npz"):
+        return NumpyPolicy.load(path)
+
+    from GoFishModels import load_model
+    return load_model(path)
+
+
+# File load_policy reads for a checkpoint path, the .npz when there is one, otherwise the .zip
+def policy_path(path):
+    base = path[:-4] if path.endswith(".zip") else path
+    return base + ".npz" if os.path.exists(base + ".npz") else base + ".zip"
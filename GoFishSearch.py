@@ -0,0 +1,250 @@
+import multiprocessing as mp
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from GoFishState import NUM_RANKS, AGENT, OPPONENT
+
+# A player with this many sets can't be caught, same rule app.py uses to end the game
+WINNING_SETS = 7
+
+
+# What the searching player can infer about the other hand from the public history
+# min_counts[r] is a lower bound on the other player's count of rank r
+# known_zero[r] means they were asked for r and have not drawn a card since
+def hidden_constraints(history, searcher="opponent"):
+    min_counts = [0] * NUM_RANKS
+    known_zero = [False] * NUM_RANKS
+
+    for event in history:
+        if event[0] == "ask":
+            _, player, rank, moved = event
+            if player == searcher:
+                # Either we took all of them or they had none
+                min_counts[rank] = 0
+                known_zero[rank] = True
+            else:
+                # They held at least one to ask, and now also hold what they took
+                min_counts[rank] = max(min_counts[rank], 1) + moved
+                known_zero[rank] = False
+        elif event[0] == "draw" and event[1] != searcher:
+            known_zero = [False] * NUM_RANKS
+
+    return min_counts, known_zero
+
+
+# Ranks the other player has seen the searcher ask for and that it may still hold,
+# an ask shows the asker holds the rank until the other player takes it
+def revealed_ranks(history, searcher="opponent"):
+    revealed = [False] * NUM_RANKS
+    for event in history:
+        if event[0] == "ask":
+            _, player, rank, moved = event
+            if player == searcher:
+                revealed[rank] = True
+            elif moved:
+                revealed[rank] = False
+    return revealed
+
+
+# Deal the unseen cards into a hidden hand and a deck order consistent with the constraints
+# A hand never holds all 4 of a rank since that would already be a set
+# Constraints that can't all hold (hands resynced from outside, etc.) are dropped, zeros first
+def sample_world(rng, unseen, hidden_size, min_counts, known_zero):
+    limit = [min(count, 3) for count in unseen]
+    for use_zero, use_min in ((True, True), (False, True), (False, False)):
+        hidden = [min(m, u) if use_min else 0 for m, u in zip(min_counts, limit)]
+        pool = []
+        for rank in range(NUM_RANKS):
+            if not (use_zero and known_zero[rank]):
+                pool.extend([rank] * (limit[rank] - hidden[rank]))
+
+        needed = hidden_size - sum(hidden)
+        if 0 <= needed <= len(pool):
+            break
+
+    needed = min(needed, len(pool))
+    drawn = rng.sample(pool, needed) if needed > 0 else []
+    for rank in drawn:
+        hidden[rank] += 1
+
+    deck = []
+    for rank in range(NUM_RANKS):
+        deck.extend([rank] * (unseen[rank] - hidden[rank]))
+    rng.shuffle(deck)
+    return hidden, deck
+
+
+# Play one game out from player asking for rank, both sides ask for a rank they know the other
+# holds when they have one and otherwise follow a noisy greedy policy
+# known[p][r] means the other player knows p holds rank r, because p asked for it
+# Returns 1 for a searcher win, 0.5 for a tie, 0 for a loss, plus a small set margin bonus
+def rollout(rng, hands, deck, sets, player, rank, searcher=OPPONENT, epsilon=0.2, known=None):
+    if known is None:
+        known = [[False] * NUM_RANKS, [False] * NUM_RANKS]
+
+    # A drawn fourth card isn't made into a set until the env's next ask, count it now
+    for p in (AGENT, OPPONENT):
+        for r in range(NUM_RANKS):
+            if hands[p][r] == 4:
+                hands[p][r] = 0
+                sets[p] += 1
+    if rank is not None and not hands[player][rank]:
+        rank = None
+
+    while sets[0] < WINNING_SETS and sets[1] < WINNING_SETS and sets[0] + sets[1] < NUM_RANKS:
+        hand = hands[player]
+
+        if rank is None:
+            held = [r for r in range(NUM_RANKS) if hand[r]]
+            if not held:
+                # Empty hand draws if it can, otherwise the turn passes
+                if deck:
+                    hand[deck.pop()] += 1
+                else:
+                    player = 1 - player
+                continue
+            targets = [r for r in held if known[1 - player][r]]
+            if targets:
+                rank = max(targets, key=hand.__getitem__)
+            elif rng.random() < epsilon:
+                rank = held[int(rng.random() * len(held))]
+            else:
+                rank = max(held, key=hand.__getitem__)
+
+        other = hands[1 - player]
+        moved = other[rank]
+        known[player][rank] = True
+        if moved:
+            other[rank] = 0
+            known[1 - player][rank] = False
+            hand[rank] += moved
+            if hand[rank] == 4:
+                hand[rank] = 0
+                sets[player] += 1
+                known[player][rank] = False
+        else:
+            # Go fish, turn passes
+            if deck:
+                card = deck.pop()
+                hand[card] += 1
+                if hand[card] == 4:
+                    hand[card] = 0
+                    sets[player] += 1
+                    known[player][card] = False
+            player = 1 - player
+        rank = None
+
+    margin = sets[searcher] - sets[1 - searcher]
+    result = 1.0 if margin > 0 else 0.5 if margin == 0 else 0.0
+    return result + 0.01 * margin
+
+
+# One worker's share of a search, samples worlds until the time budget runs out
+# Every candidate ask is rolled out in every sampled world
+def search_worker(task):
+    own, unseen, hidden_size, sets, min_counts, known_zero, revealed, candidates, budget, max_worlds, seed = task
+    rng = random.Random(seed)
+    deadline = time.perf_counter() + budget
+
+    totals = [0.0] * len(candidates)
+    worlds = 0
+    while worlds < max_worlds and (worlds == 0 or time.perf_counter() < deadline):
+        hidden, deck = sample_world(rng, unseen, hidden_size, min_counts, known_zero)
+
+        # Every candidate plays the world out with the same random choices, so the comparison
+        # between them isn't drowned out by rollout noise
+        rollout_seed = rng.random()
+        for i, rank in enumerate(candidates):
+            hands = [None, None]
+            hands[AGENT] = list(hidden)
+            hands[OPPONENT] = list(own)
+            known = [None, None]
+            known[AGENT] = [count > 0 for count in min_counts]
+            known[OPPONENT] = [revealed[r] and own[r] > 0 for r in range(NUM_RANKS)]
+            totals[i] += rollout(random.Random(rollout_seed), hands, list(deck), list(sets), OPPONENT, rank, known=known)
+        worlds += 1
+
+    return totals, worlds
+
+
+# Process pool for search workers, forkserver where available so workers don't inherit the caller's state
+def make_search_pool(num_workers=None):
+    method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=num_workers or os.cpu_count() or 1, mp_context=mp.get_context(method))
+
+
+# Determinized Monte Carlo search opponent for play mode
+# Pass it to GoFishEnv.set_model, play_opponent_turn then calls act(env) instead of a network
+class SearchAgent:
+    # pool is an executor shared with other agents (app.py has one for every session),
+    # otherwise the agent starts its own on the first search and close() shuts it down
+    def __init__(self, time_budget=1.0, num_workers=None, max_worlds=None, seed=None, pool=None):
+        self.time_budget = time_budget
+        self.num_workers = num_workers if num_workers is not None else (os.cpu_count() or 1)
+        self.max_worlds = max_worlds if max_worlds is not None else float("inf")
+        self.seeds = np.random.SeedSequence(seed)
+        self.pool = pool
+        self.owns_pool = pool is None
+
+    # Best rank for the env's opponent to ask for
+    def act(self, env):
+        own = env._hand_counts("opponent")
+
+        # Cards we can't see: not in our hand and not in a completed set
+        done = [a or o for a, o in zip(env.agent_sets, env.opponent_sets)]
+        unseen = [0 if done[rank] else 4 - own[rank] for rank in range(NUM_RANKS)]
+        sets = [0, 0]
+        sets[AGENT] = env._sets_completed("agent")
+        sets[OPPONENT] = env._sets_completed("opponent")
+        min_counts, known_zero = hidden_constraints(env.history)
+        revealed = revealed_ranks(env.history)
+        return self.search(own, unseen, len(env.agent_hand), sets, min_counts, known_zero, revealed)
+
+    # Best ask for the searching hand own against a hidden hand of hidden_size cards
+    # revealed[r] means the other player knows we hold r, none known if not given
+    def search(self, own, unseen, hidden_size, sets, min_counts, known_zero, revealed=None):
+        if revealed is None:
+            revealed = [False] * NUM_RANKS
+        candidates = [rank for rank in range(NUM_RANKS) if own[rank]]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else 0
+
+        # A rank the other hand is known to hold is a sure catch, take the biggest one without searching
+        sure = [rank for rank in candidates if min_counts[rank] > 0]
+        if sure:
+            return max(sure, key=own.__getitem__)
+
+        # Ranks they're known not to hold only waste the turn
+        candidates = [rank for rank in candidates if not known_zero[rank]] or candidates
+        if len(candidates) == 1:
+            return candidates[0]
+        hidden_size = min(hidden_size, sum(min(count, 3) for count in unseen))
+
+        workers = max(1, self.num_workers)
+        worlds_each = -(-self.max_worlds // workers) if self.max_worlds != float("inf") else self.max_worlds
+        tasks = [
+            (own, unseen, hidden_size, sets, min_counts, known_zero, revealed, candidates,
+             self.time_budget, worlds_each, int(child.generate_state(1)[0]))
+            for child in self.seeds.spawn(workers)
+        ]
+
+        if workers == 1:
+            results = [search_worker(tasks[0])]
+        else:
+            results = list(self._get_pool().map(search_worker, tasks))
+
+        totals = np.sum([result[0] for result in results], axis=0)
+        return candidates[int(np.argmax(totals))]
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = make_search_pool(self.num_workers)
+        return self.pool
+
+    def close(self):
+        if self.pool is not None and self.owns_pool:
+            self.pool.shutdown()
+        self.pool = None
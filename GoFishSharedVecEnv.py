@@ -0,0 +1,255 @@
+import ctypes
+import multiprocessing as mp
+import os
+from threading import BrokenBarrierError
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+from GoFishEnv import spawn_seeds
+from GoFishVecEnv import GoFishVecEnv
+
+# Commands the learner hands to workers through shared memory
+STEP = 0
+RESET = 1
+CLOSE = 2
+GET_STATE = 3
+SET_STATE = 4
+
+# info["reason"] and info["truncation_reason"] values, stored as small ints in shared memory
+REASONS = ["", "moved_out_of_turn", "invalid_action"]
+TRUNCATIONS = ["", "no_progress", "max_steps"]
+
+
+# Numpy view over a raw shared buffer, rebuilt the same way in every process
+def _view(raw, shape, dtype):
+    return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _shared_array(ctx, shape, dtype):
+    raw = ctx.RawArray(ctypes.c_byte, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    return raw, (shape, np.dtype(dtype).str)
+
+
+# Worker loop, runs a block of games as a GoFishVecEnv writing straight into shared memory
+# Game states only go through the pipe, for checkpoints
+def _worker(start, stop, buffers, start_barrier, end_barrier, opponent, truncation, pipe):
+    views = {name: _view(raw, *layout) for name, (raw, layout) in buffers.items()}
+    block = slice(start, stop)
+
+    # Opponents that keep per game state only get this worker's games
+    if hasattr(opponent, "for_block"):
+        opponent = opponent.for_block(block)
+
+    venv = GoFishVecEnv(stop - start, buf_obs=views["obs"][block], opponent=opponent, **truncation)
+    rewards = views["rewards"][block]
+    dones = views["dones"][block]
+    reasons = views["reasons"][block]
+    truncations = views["truncations"][block]
+    terminal = views["terminal"][block]
+    masks = views["masks"][block]
+
+    try:
+        while True:
+            start_barrier.wait()
+            command = views["command"][0]
+
+            if command == CLOSE:
+                break
+
+            if command == RESET:
+                seeds = views["seeds"][block]
+                has_seed = views["has_seed"][block]
+                venv._seeds = [int(seed) if has else None for seed, has in zip(seeds, has_seed)]
+                venv.reset()
+                masks[:] = venv.action_masks()
+
+            elif command == STEP:
+                step_rewards, step_dones, infos = venv._step_games(views["actions"][block])
+                rewards[:] = step_rewards
+                dones[:] = step_dones
+                for i, info in enumerate(infos):
+                    reasons[i] = REASONS.index(info.get("reason", ""))
+                    truncations[i] = TRUNCATIONS.index(info.get("truncation_reason", ""))
+                    if step_dones[i]:
+                        terminal[i] = info["terminal_observation"]
+                masks[:] = venv.action_masks()
+
+            elif command == GET_STATE:
+                pipe.send(venv.get_state())
+
+            elif command == SET_STATE:
+                venv.set_state(pipe.recv())
+                masks[:] = venv.action_masks()
+
+            end_barrier.wait()
+
+    except BrokenBarrierError:
+        pass
+    except BaseException:
+        # Wake the learner up instead of leaving it waiting on a dead worker
+        start_barrier.abort()
+        end_barrier.abort()
+        raise
+
+
+# Multiprocess Go Fish, each worker steps a block of games and shares results
+# through shared memory buffers, the learner and workers only meet at two barriers per step
+# opponent is sent to every worker, so it has to pickle (a registered name always does,
+# and a LeagueOpponent built on a LeaguePool(shared=True) keeps sharing its pool)
+class GoFishSharedVecEnv(VecEnv):
+    def __init__(self, num_envs=64, num_workers=None, seed=None, start_method=None, opponent="greedy",
+                 max_steps=None, max_stalled_steps=None):
+        template = GoFishVecEnv(1)
+        self.render_mode = None
+        super().__init__(num_envs, template.observation_space, template.action_space)
+
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        num_workers = max(1, min(num_workers, num_envs))
+
+        # Same default start method as SubprocVecEnv
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        n = num_envs
+        obs_shape = (n,) + self.observation_space.shape
+        obs_dtype = self.observation_space.dtype
+        self.buffers = {
+            "obs": _shared_array(ctx, obs_shape, obs_dtype),
+            "terminal": _shared_array(ctx, obs_shape, obs_dtype),
+            "rewards": _shared_array(ctx, (n,), np.float32),
+            "dones": _shared_array(ctx, (n,), bool),
+            "reasons": _shared_array(ctx, (n,), np.int8),
+            "truncations": _shared_array(ctx, (n,), np.int8),
+            "masks": _shared_array(ctx, (n, self.action_space.n), bool),
+            "actions": _shared_array(ctx, (n,), np.int64),
+            "seeds": _shared_array(ctx, (n,), np.uint64),
+            "has_seed": _shared_array(ctx, (n,), bool),
+            "command": _shared_array(ctx, (1,), np.int64),
+        }
+        self.views = {name: _view(raw, *layout) for name, (raw, layout) in self.buffers.items()}
+
+        self.start_barrier = ctx.Barrier(num_workers + 1)
+        self.end_barrier = ctx.Barrier(num_workers + 1)
+
+        self.processes = []
+        self.pipes = []
+        self.bounds = np.linspace(0, n, num_workers + 1).astype(int)
+        truncation = {"max_steps": max_steps, "max_stalled_steps": max_stalled_steps}
+        for start, stop in zip(self.bounds[:-1], self.bounds[1:]):
+            pipe, worker_pipe = ctx.Pipe()
+            args = (int(start), int(stop), self.buffers, self.start_barrier, self.end_barrier, opponent, truncation,
+                    worker_pipe)
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            self.pipes.append(pipe)
+
+        self.waiting = False
+        self.closed = False
+
+        if seed is not None:
+            self.seed(seed)
+
+    def _run(self, command):
+        self.views["command"][0] = command
+        self.start_barrier.wait()
+
+    # Same per game seeds as GoFishVecEnv, independent of how games are split across workers
+    def seed(self, seed=None):
+        if seed is None:
+            seed = int(np.random.randint(0, np.iinfo(np.uint32).max, dtype=np.uint32))
+        self._seeds = spawn_seeds(seed, self.num_envs)
+        return self._seeds
+
+    def reset(self):
+        self.views["has_seed"][:] = [seed is not None for seed in self._seeds]
+        self.views["seeds"][:] = [seed if seed is not None else 0 for seed in self._seeds]
+        self._reset_seeds()
+        self._reset_options()
+
+        self._run(RESET)
+        self.end_barrier.wait()
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return self.views["obs"].copy()
+
+    def step_async(self, actions):
+        self.views["actions"][:] = np.asarray(actions).reshape(self.num_envs)
+        self._run(STEP)
+        self.waiting = True
+
+    def step_wait(self):
+        self.end_barrier.wait()
+        self.waiting = False
+
+        dones = self.views["dones"].copy()
+        reasons = self.views["reasons"]
+        truncations = self.views["truncations"]
+        terminal = self.views["terminal"]
+
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(reasons):
+            infos[i]["reason"] = REASONS[reasons[i]]
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = terminal[i].copy()
+            infos[i]["TimeLimit.truncated"] = bool(truncations[i])
+            if truncations[i]:
+                infos[i]["truncation_reason"] = TRUNCATIONS[truncations[i]]
+
+        return self.views["obs"].copy(), self.views["rewards"].copy(), dones, infos
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self.end_barrier.wait()
+        try:
+            self._run(CLOSE)
+        except BrokenBarrierError:
+            pass
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    # Same layout as GoFishVecEnv.get_state, so a state can move between the two envs
+    # or to a different number of workers
+    def get_state(self):
+        self._run(GET_STATE)
+        blocks = [pipe.recv() for pipe in self.pipes]
+        self.end_barrier.wait()
+
+        state = {name: np.concatenate([block[name] for block in blocks]) for name in GoFishVecEnv.STATE_FIELDS}
+        state["rngs"] = [rng_state for block in blocks for rng_state in block["rngs"]]
+        return state
+
+    def set_state(self, state):
+        self._run(SET_STATE)
+        for pipe, start, stop in zip(self.pipes, self.bounds[:-1], self.bounds[1:]):
+            block = {name: state[name][start:stop] for name in GoFishVecEnv.STATE_FIELDS}
+            block["rngs"] = state["rngs"][start:stop]
+            pipe.send(block)
+        self.end_barrier.wait()
+
+    # Written by the workers after every reset and step
+    def action_masks(self):
+        return self.views["masks"].copy()
+
+    # Game state lives in the workers, attribute access only reaches this object
+    # except for methods in batched_methods, which return one row per game
+    batched_methods = ("action_masks",)
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        if method_name in self.batched_methods:
+            return [result[i] for i in self._get_indices(indices)]
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
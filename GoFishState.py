@@ -0,0 +1,194 @@
+import numpy as np
+
+NUM_RANKS = 13
+ALL_SETS = (1 << NUM_RANKS) - 1
+
+# Player rows in the count arrays
+AGENT = 0
+OPPONENT = 1
+
+FAIL_MEMORY = 16
+
+# RING_ORDER[head] lists ring buffer slots oldest first when the next write goes to head
+RING_ORDER = (np.arange(FAIL_MEMORY)[None, :] + np.arange(FAIL_MEMORY)[:, None]) % FAIL_MEMORY
+
+# Fixed size game snapshot used by GoFishEnv.get_state / set_state
+# The deck is padded with -1 past deck_size, failed asks are stored oldest first
+STATE_DTYPE = np.dtype([
+    ("deck", np.int8, 52),
+    ("deck_size", np.int8),
+    ("hands", np.int8, (2, NUM_RANKS)),
+    ("sets_mask", np.uint16, 2),
+    ("agent_turn", np.bool_),
+    ("turn_counter", np.int32),
+    ("last_ask", np.int8, 2),
+    ("last_ask_success", np.int8, 2),
+    ("fail_ranks", np.int8, FAIL_MEMORY),
+    ("fail_turns", np.int32, FAIL_MEMORY),
+    ("step_count", np.int32),
+    ("stalled_steps", np.int32),
+    ("progress", np.int16, 2),
+])
+
+
+# Count-vector game state, each hand is a fixed 13 slot array of rank counts
+# Asks, transfers, set checks and observations are all O(13) array ops
+class CountState:
+    # Only one failed ask can happen per agent turn, so the last 16 failures
+    # always cover the 5 and 10 turn penalty windows used by the env
+    FAIL_MEMORY = FAIL_MEMORY
+
+    def __init__(self):
+        self.hands = np.zeros((2, NUM_RANKS), dtype=np.int8)
+        self.hand_sizes = [0, 0]
+
+        # Completed sets as bitmasks, bit r is set once rank r is completed
+        self.sets_mask = [0, 0]
+        self.set_counts = [0, 0]
+
+        # Ring buffer of (rank, turn) for failed agent asks
+        self.fail_ranks = np.full(self.FAIL_MEMORY, -1, dtype=np.int8)
+        self.fail_turns = np.zeros(self.FAIL_MEMORY, dtype=np.int32)
+        self.fail_head = 0
+
+    def clear(self):
+        self.hands.fill(0)
+        self.hand_sizes[:] = [0, 0]
+        self.sets_mask[:] = [0, 0]
+        self.set_counts[:] = [0, 0]
+        self.fail_ranks.fill(-1)
+        self.fail_turns.fill(0)
+        self.fail_head = 0
+
+    # Copy hands, sets and failed asks into a STATE_DTYPE record
+    def save(self, record):
+        record["hands"] = self.hands
+        record["sets_mask"] = self.sets_mask
+        oldest_first = RING_ORDER[self.fail_head]
+        record["fail_ranks"] = self.fail_ranks[oldest_first]
+        record["fail_turns"] = self.fail_turns[oldest_first]
+
+    def load(self, record):
+        self.hands[:] = record["hands"]
+        self.hand_sizes[:] = self.hands.sum(axis=1).tolist()
+        self.sets_mask[:] = [int(mask) for mask in record["sets_mask"]]
+        self.set_counts[:] = [bin(mask).count("1") for mask in self.sets_mask]
+        self.fail_ranks[:] = record["fail_ranks"]
+        self.fail_turns[:] = record["fail_turns"]
+        self.fail_head = 0
+
+    # Replace a hand from a list of ranks
+    def set_hand(self, player, ranks):
+        hand = self.hands[player]
+        hand.fill(0)
+        np.add.at(hand, np.asarray(list(ranks), dtype=np.intp), 1)
+        self.hand_sizes[player] = int(hand.sum())
+
+    def add(self, player, rank):
+        self.hands[player, rank] += 1
+        self.hand_sizes[player] += 1
+
+    def remove(self, player, rank, n=1):
+        self.hands[player, rank] -= n
+        self.hand_sizes[player] -= n
+
+    def has(self, player, rank):
+        return self.hands[player, rank] > 0
+
+    # Move every card of rank from the other player to player, returns cards moved
+    def ask(self, player, rank):
+        other = 1 - player
+        moved = int(self.hands[other, rank])
+        if moved:
+            self.hands[player, rank] += moved
+            self.hands[other, rank] = 0
+            self.hand_sizes[player] += moved
+            self.hand_sizes[other] -= moved
+        return moved
+
+    # Remove any completed sets from both hands
+    def update_sets(self):
+        for player, rank in zip(*np.nonzero(self.hands == 4)):
+            if not (self.sets_mask[player] >> rank) & 1:
+                self.sets_mask[player] |= 1 << int(rank)
+                self.set_counts[player] += 1
+                self.hands[player, rank] = 0
+                self.hand_sizes[player] -= 4
+
+    def sets_list(self, player):
+        mask = self.sets_mask[player]
+        return [(mask >> rank) & 1 for rank in range(NUM_RANKS)]
+
+    def set_sets(self, player, sets):
+        mask = 0
+        for rank, done in enumerate(sets):
+            if done:
+                mask |= 1 << rank
+        self.sets_mask[player] = mask
+        self.set_counts[player] = bin(mask).count("1")
+
+    def all_sets_done(self):
+        return (self.sets_mask[0] | self.sets_mask[1]) == ALL_SETS
+
+    def record_fail(self, rank, turn):
+        self.fail_ranks[self.fail_head] = rank
+        self.fail_turns[self.fail_head] = turn
+        self.fail_head = (self.fail_head + 1) % self.FAIL_MEMORY
+
+    # Number of failed asks for rank within window turns of turn
+    def recent_fails(self, rank, turn, window=5):
+        recent = (self.fail_ranks == rank) & (turn - self.fail_turns <= window)
+        return int(np.count_nonzero(recent))
+
+    # Dict of rank -> list of turns, same shape as GoFishEnv.recent_failed_asks
+    def fails_dict(self, turn, window=10):
+        fails = {}
+        order = [(self.fail_head + i) % self.FAIL_MEMORY for i in range(self.FAIL_MEMORY)]
+        for i in order:
+            rank = int(self.fail_ranks[i])
+            if rank >= 0 and turn - int(self.fail_turns[i]) <= window:
+                fails.setdefault(rank, []).append(int(self.fail_turns[i]))
+        return fails
+
+
+# List-like view of one hand in a CountState, so code that treats hands as
+# lists of ranks (app.py, play_agent.py) keeps working
+class HandView:
+    def __init__(self, state, player):
+        self.state = state
+        self.player = player
+
+    def count(self, rank):
+        if not 0 <= rank < NUM_RANKS:
+            return 0
+        return int(self.state.hands[self.player, rank])
+
+    def append(self, rank):
+        self.state.add(self.player, rank)
+
+    def extend(self, ranks):
+        for rank in ranks:
+            self.state.add(self.player, rank)
+
+    def remove(self, rank):
+        if not self.__contains__(rank):
+            raise ValueError(f"{rank} not in hand")
+        self.state.remove(self.player, rank)
+
+    def __contains__(self, rank):
+        return 0 <= rank < NUM_RANKS and self.state.hands[self.player, rank] > 0
+
+    def __len__(self):
+        return self.state.hand_sizes[self.player]
+
+    def __iter__(self):
+        return iter(np.repeat(np.arange(NUM_RANKS), self.state.hands[self.player]).tolist())
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+        return sorted(self) == sorted(other)
+
+    def __repr__(self):
+        return repr(list(self))
@@ -0,0 +1,363 @@
+import copy
+import json
+import multiprocessing as mp
+import os
+import pickle
+import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback, CallbackList
+from sb3_contrib import MaskablePPO
+
+from GoFishModels import load_model, policy_arrays, export_policy
+from GoFishVecEnv import GoFishVecEnv
+from GoFishSharedVecEnv import GoFishSharedVecEnv
+from GoFishLeague import LeaguePool, LeagueOpponent, LeagueCallback
+from GoFishPolicy import mlp_shapes, mlp_logits
+
+DEFAULT_CONFIG = {
+    # Checkpoints, eval snapshots and emitted models go in run_dir/run_name
+    "run_dir": "runs",
+    "run_name": "GoFish",
+    "seed": 0,
+    "verbose": 1,
+
+    # "maskable_ppo" only lets the agent ask for ranks it holds, "ppo" is the original setup
+    "algorithm": "maskable_ppo",
+    "total_timesteps": 40_000,
+    "net_arch": [64, 64],
+    # Passed straight to PPO / MaskablePPO, anything left out keeps the SB3 default
+    "ppo": {"n_steps": 128},
+
+    # "batched" steps every game in this process, "shared" splits them across worker processes
+    "vec_env": "batched",
+    "num_envs": 16,
+    "num_workers": None,
+    # Games are truncated after this many agent steps, or after this many in a row without progress
+    "max_steps_per_game": 500,
+    "max_stalled_steps": 50,
+
+    # Training opponent, any name registered in GoFishOpponents
+    # With the league on it's the fallback the snapshots are mixed with
+    "opponent": "greedy",
+    "league": {"enabled": False, "capacity": 16, "snapshot_every": 10_000, "fallback_prob": 0.2, "exponent": 2.0},
+
+    # Checkpoints are written between rollouts and keep everything needed to resume exactly
+    "checkpoint_every": 20_000,
+    "keep_checkpoints": 3,
+
+    # Evaluation runs in its own process pool while training carries on
+    # eval_workers 0 evaluates inline instead
+    "eval_every": 20_000,
+    "eval_games": 1000,
+    "eval_workers": 2,
+    # Asks are masked to legal ones, against greedy even random legal asks win about 74% of games,
+    # memory leaves room between random (about 50%) and a trained policy
+    "eval_opponent": "memory",
+    "eval_seed": 12345,
+    "eval_deterministic": False,
+
+    # The first evaluation whose win rate beats random legal asks by each margin is saved as GoFish_Model_<tier>
+    # The random baseline is measured with the same eval settings when training starts
+    # An untrained actor lands within 0.01 of it, the shipped hard model about 0.08 above it
+    "milestones": {"easy": 0.03, "medium": 0.06, "hard": 0.08},
+    # None writes emitted models into the run directory, "." replaces the models app.py loads
+    "output_dir": None,
+}
+
+ALGORITHMS = {"maskable_ppo": MaskablePPO, "ppo": PPO}
+
+
+# Defaults overridden by a JSON file and then by keyword arguments, nested dicts are merged
+def load_config(path=None, **overrides):
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    updates = []
+    if path is not None:
+        with open(path) as f:
+            updates.append(json.load(f))
+    updates.append(overrides)
+
+    for update in updates:
+        for key, value in update.items():
+            if key not in config:
+                raise ValueError(f"Unknown config key: {key}")
+            if isinstance(config[key], dict) and isinstance(value, dict):
+                config[key] = dict(config[key], **value)
+            else:
+                config[key] = value
+    return config
+
+
+def make_env(config, opponent):
+    truncation = {"max_steps": config["max_steps_per_game"], "max_stalled_steps": config["max_stalled_steps"]}
+    if config["vec_env"] == "batched":
+        return GoFishVecEnv(config["num_envs"], opponent=opponent, **truncation)
+    if config["vec_env"] == "shared":
+        return GoFishSharedVecEnv(config["num_envs"], num_workers=config["num_workers"], opponent=opponent, **truncation)
+    raise ValueError(f"Unknown vec_env: {config['vec_env']}")
+
+
+# Play num_games games of the actor in arrays (see policy_arrays) against opponent
+# arrays None plays uniformly random legal asks
+# Every game counts once, games the env truncates are skipped
+def evaluate_arrays(arrays, num_games, seed, opponent="greedy", deterministic=False, max_steps=500,
+                    max_stalled_steps=50):
+    env = GoFishVecEnv(num_games, seed=seed, opponent=opponent, max_steps=max_steps, max_stalled_steps=max_stalled_steps)
+    rng = np.random.default_rng(seed)
+    sets_slot = env.offsets["agent_sets_completed"]
+    opponent_sets_slot = env.offsets["opponent_sets_completed"]
+
+    obs = env.reset()
+    finished = np.zeros(num_games, dtype=bool)
+    wins = losses = ties = skipped = 0
+    while not finished.all():
+        logits = np.where(env.action_masks(), 0.0 if arrays is None else mlp_logits(arrays, obs), -np.inf)
+        if not deterministic:
+            logits = logits + rng.gumbel(size=logits.shape)
+        obs, _, dones, infos = env.step(logits.argmax(axis=1))
+
+        for i in np.flatnonzero(dones & ~finished):
+            if infos[i]["TimeLimit.truncated"]:
+                skipped += 1
+                continue
+            terminal = infos[i]["terminal_observation"]
+            margin = terminal[sets_slot:sets_slot + 14].argmax() - terminal[opponent_sets_slot:opponent_sets_slot + 14].argmax()
+            wins += margin > 0
+            losses += margin < 0
+            ties += margin == 0
+        finished |= dones
+
+    return {"wins": int(wins), "losses": int(losses), "ties": int(ties), "skipped": skipped}
+
+
+def win_rate(result):
+    played = result["wins"] + result["losses"] + result["ties"]
+    return result["wins"] / played if played else 0.0
+
+
+# Tiers whose margin over the random legal baseline a win rate reaches, lowest margin first
+def milestone_tiers(milestones, baseline, rate):
+    return [tier for tier, margin in sorted(milestones.items(), key=lambda item: item[1]) if rate >= baseline + margin]
+
+
+def latest_checkpoint(run_path):
+    if not os.path.isdir(run_path):
+        return None
+    names = sorted(name for name in os.listdir(run_path) if name.startswith("checkpoint_") and not name.endswith(".tmp"))
+    return os.path.join(run_path, names[-1]) if names else None
+
+
+# Checkpoints, in-loop evaluation and milestone models
+class TrainingCallback(BaseCallback):
+    def __init__(self, config, run_path, pool=None, league_callback=None):
+        super().__init__(config["verbose"])
+        self.config = config
+        self.run_path = run_path
+        self.output_dir = config["output_dir"] if config["output_dir"] is not None else run_path
+        self.pool = pool
+        self.league_callback = league_callback
+
+        self.last_checkpoint = 0
+        self.last_eval = 0
+        self.emitted = {}
+        self.evaluations = []
+        # Win rate of random legal asks, what the milestone margins are measured from
+        self.baseline = None
+
+        self.executor = None
+        self.pending = []
+        # Evaluations still running at the checkpoint a run resumed from
+        self.unfinished = []
+
+    def _on_training_start(self):
+        if self.baseline is None:
+            result = evaluate_arrays(None, self.config["eval_games"], self.config["eval_seed"], self.config["eval_opponent"],
+                                     False, self.config["max_steps_per_game"], self.config["max_stalled_steps"])
+            self.baseline = win_rate(result)
+            self.logger.record("eval/baseline_win_rate", self.baseline)
+            if self.verbose:
+                print(f"Random legal asks: {self.baseline:.2%} win rate")
+
+        if self.config["eval_workers"] > 0:
+            method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+            self.executor = ProcessPoolExecutor(self.config["eval_workers"], mp_context=mp.get_context(method))
+
+        for steps, snapshot in self.unfinished:
+            if os.path.exists(snapshot):
+                self._submit_evaluation(steps, snapshot, policy_arrays(load_model(snapshot)))
+        self.unfinished = []
+
+    # Rollout start comes right after a PPO update, the one point where nothing is half done
+    def _on_rollout_start(self):
+        self._collect_evaluations()
+
+        steps = self.num_timesteps
+        if self.config["eval_every"] and steps - self.last_eval >= self.config["eval_every"]:
+            self._evaluate()
+            self._collect_evaluations()
+        if self.config["checkpoint_every"] and steps - self.last_checkpoint >= self.config["checkpoint_every"]:
+            self.save_checkpoint()
+
+    def _on_step(self):
+        return True
+
+    def _on_training_end(self):
+        if self.config["eval_every"] and self.num_timesteps > self.last_eval:
+            self._evaluate()
+        self._collect_evaluations(wait=True)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def _evaluate(self):
+        steps = self.num_timesteps
+        self.last_eval = steps
+
+        # The model keeps training, so the evaluated weights are saved now in case they hit a milestone
+        snapshot = os.path.join(self.run_path, f"eval_{steps:012d}.zip")
+        self.model.save(snapshot)
+        self._submit_evaluation(steps, snapshot, policy_arrays(self.model))
+
+    def _submit_evaluation(self, steps, snapshot, arrays):
+        args = (arrays, self.config["eval_games"], self.config["eval_seed"], self.config["eval_opponent"],
+                self.config["eval_deterministic"], self.config["max_steps_per_game"], self.config["max_stalled_steps"])
+        if self.executor is None:
+            result = evaluate_arrays(*args)
+            self.pending.append((steps, snapshot, None, result))
+        else:
+            self.pending.append((steps, snapshot, self.executor.submit(evaluate_arrays, *args), None))
+
+    # Handle finished evaluations in the order they were submitted
+    def _collect_evaluations(self, wait=False):
+        while self.pending:
+            steps, snapshot, future, result = self.pending[0]
+            if future is not None:
+                if not wait and not future.done():
+                    break
+                result = future.result()
+            self.pending.pop(0)
+
+            rate = win_rate(result)
+            self.evaluations.append(dict(result, steps=steps, win_rate=rate))
+            self.logger.record("eval/win_rate", rate)
+            if self.verbose:
+                played = result["wins"] + result["losses"] + result["ties"]
+                print(f"Eval at {steps} steps: {rate:.2%} win rate over {played} games")
+
+            for tier in milestone_tiers(self.config["milestones"], self.baseline, rate):
+                if tier not in self.emitted:
+                    # The exported policy is what app.py serves, write it too so it never goes stale
+                    shutil.copyfile(snapshot, os.path.join(self.output_dir, f"GoFish_Model_{tier}.zip"))
+                    export_policy(snapshot, os.path.join(self.output_dir, f"GoFish_Model_{tier}.npz"))
+                    self.emitted[tier] = steps
+                    if self.verbose:
+                        print(f"Saved GoFish_Model_{tier} from {steps} steps")
+            os.remove(snapshot)
+
+    def get_state(self):
+        state = {
+            "last_checkpoint": self.last_checkpoint,
+            "last_eval": self.last_eval,
+            "emitted": self.emitted,
+            "evaluations": self.evaluations,
+            "baseline": self.baseline,
+            "unfinished": [(steps, snapshot) for steps, snapshot, _, _ in self.pending],
+        }
+        if self.league_callback is not None:
+            state["last_snapshot"] = self.league_callback.last_snapshot
+        return state
+
+    def set_state(self, state):
+        self.last_checkpoint = state["last_checkpoint"]
+        self.last_eval = state["last_eval"]
+        self.emitted = state["emitted"]
+        self.evaluations = state["evaluations"]
+        self.baseline = state.get("baseline")
+        self.unfinished = state["unfinished"]
+        if self.league_callback is not None:
+            self.league_callback.last_snapshot = state["last_snapshot"]
+
+    # Model and optimizer go in model.zip, games, rngs, league and bookkeeping in state.pkl
+    # Written to a .tmp directory first, so a run killed mid write keeps its previous checkpoint
+    def save_checkpoint(self):
+        steps = self.num_timesteps
+        self.last_checkpoint = steps
+        path = os.path.join(self.run_path, f"checkpoint_{steps:012d}")
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        self.model.save(os.path.join(tmp_path, "model.zip"))
+        state = {
+            "env": self.model.get_env().get_state(),
+            "league": self.pool.get_state() if self.pool is not None else None,
+            "rng": {"random": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()},
+            "callback": self.get_state(),
+        }
+        with open(os.path.join(tmp_path, "state.pkl"), "wb") as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, path)
+
+        checkpoints = sorted(name for name in os.listdir(self.run_path) if name.startswith("checkpoint_") and not name.endswith(".tmp"))
+        for name in checkpoints[:-self.config["keep_checkpoints"]]:
+            shutil.rmtree(os.path.join(self.run_path, name))
+
+
+# Train with config (see load_config), picking up from the run's latest checkpoint if there is one
+def train(config):
+    run_path = os.path.join(config["run_dir"], config["run_name"])
+    os.makedirs(run_path, exist_ok=True)
+    if config["output_dir"] is not None:
+        os.makedirs(config["output_dir"], exist_ok=True)
+    checkpoint = latest_checkpoint(run_path)
+    if checkpoint is None:
+        with open(os.path.join(run_path, "config.json"), "w") as f:
+            json.dump(config, f, indent=2)
+
+    pool = None
+    opponent = config["opponent"]
+    league = config["league"]
+    if league["enabled"]:
+        obs_dim = GoFishVecEnv(1).observation_space.shape[0]
+        pool = LeaguePool(mlp_shapes(obs_dim, config["net_arch"]), config["num_envs"],
+                          capacity=league["capacity"], shared=config["vec_env"] == "shared")
+        opponent = LeagueOpponent(pool, fallback=opponent, fallback_prob=league["fallback_prob"])
+
+    env = make_env(config, opponent)
+    algorithm = ALGORITHMS[config["algorithm"]]
+
+    league_callback = None
+    if pool is not None:
+        league_callback = LeagueCallback(pool, snapshot_every=league["snapshot_every"], exponent=league["exponent"])
+    training_callback = TrainingCallback(config, run_path, pool, league_callback)
+
+    if checkpoint is None:
+        model = algorithm("MlpPolicy", env, seed=config["seed"], verbose=config["verbose"],
+                          policy_kwargs={"net_arch": list(config["net_arch"])}, **config["ppo"])
+    else:
+        if config["verbose"]:
+            print(f"Resuming from {checkpoint}")
+        # force_reset=False keeps the saved last observation, the games are restored below
+        model = algorithm.load(os.path.join(checkpoint, "model.zip"), env=env, force_reset=False)
+        with open(os.path.join(checkpoint, "state.pkl"), "rb") as f:
+            state = pickle.load(f)
+        env.set_state(state["env"])
+        if pool is not None:
+            pool.set_state(state["league"])
+        training_callback.set_state(state["callback"])
+        random.setstate(state["rng"]["random"])
+        np.random.set_state(state["rng"]["numpy"])
+        torch.set_rng_state(state["rng"]["torch"])
+
+    callbacks = [training_callback] + ([league_callback] if league_callback is not None else [])
+    remaining = config["total_timesteps"] - model.num_timesteps
+    if remaining > 0:
+        model.learn(remaining, callback=CallbackList(callbacks), reset_num_timesteps=checkpoint is None)
+
+    model.save(os.path.join(training_callback.output_dir, "GoFish_Model"))
+    export_policy(model, os.path.join(training_callback.output_dir, "GoFish_Model.npz"))
+    env.close()
+    return model
@@ -0,0 +1,399 @@
+import numpy as np
+from gymnasium.spaces.utils import flatten_space
+from stable_baselines3.common.vec_env import VecEnv
+
+from GoFishEnv import GoFishEnv, flat_offsets, spawn_seeds
+from GoFishState import NUM_RANKS, AGENT, OPPONENT, FAIL_MEMORY
+from GoFishOpponents import make_opponent
+
+
+# Batched Go Fish, steps N training games in lockstep with NumPy
+# Follows GoFishEnv.training_step exactly: game i seeded with s plays the same
+# game as GoFishEnv().reset(seed=s), since each game owns a np.random.Generator
+# that is consumed in the same order as GoFishEnv consumes its np_random
+# The batch doubles as the games view the opponent policies in GoFishOpponents act on
+class GoFishVecEnv(VecEnv):
+    # buf_obs lets a caller supply the array observations are written into
+    # max_steps and max_stalled_steps truncate games like they do in GoFishEnv
+    def __init__(self, num_envs=16, seed=None, buf_obs=None, opponent="greedy", max_steps=None, max_stalled_steps=None):
+        template = GoFishEnv()
+        self.dict_space = template.observation_space
+        self.offsets = flat_offsets(self.dict_space)
+        self.base_deck = template._init_deck()
+
+        # Observations come out already flattened, same layout as FlattenObservation
+        self.render_mode = None
+        super().__init__(num_envs, flatten_space(self.dict_space), template.action_space)
+
+        n = num_envs
+        self.rngs = [np.random.default_rng() for _ in range(n)]
+
+        # Deck i is decks[i, deck_lo[i]:deck_hi[i]], pop() takes from the top end
+        self.decks = np.zeros((n, 52), dtype=np.int8)
+        self.deck_lo = np.zeros(n, dtype=np.int64)
+        self.deck_hi = np.zeros(n, dtype=np.int64)
+
+        # Row AGENT / OPPONENT of each game
+        self.hands = np.zeros((n, 2, NUM_RANKS), dtype=np.int8)
+        self.hand_sizes = np.zeros((n, 2), dtype=np.int64)
+        self.sets = np.zeros((n, 2, NUM_RANKS), dtype=bool)
+        self.set_counts = np.zeros((n, 2), dtype=np.int64)
+
+        self.agent_turn = np.zeros(n, dtype=bool)
+        self.coin_flip_result = np.zeros(n, dtype=np.int64)
+        self.turn_counter = np.zeros(n, dtype=np.int64)
+
+        # Memory of the last ask per player, 13 means no ask yet
+        self.last_ask = np.full((n, 2), 13, dtype=np.int64)
+        self.last_ask_success = np.zeros((n, 2), dtype=np.int64)
+
+        # Failed agent asks as a ring buffer of (rank, turn)
+        self.fail_ranks = np.full((n, FAIL_MEMORY), -1, dtype=np.int64)
+        self.fail_turns = np.zeros((n, FAIL_MEMORY), dtype=np.int64)
+        self.fail_head = np.zeros(n, dtype=np.int64)
+
+        # Truncation counters, progress holds each game's GoFishEnv._progress_marker
+        self.max_steps = max_steps
+        self.max_stalled_steps = max_stalled_steps
+        self.step_count = np.zeros(n, dtype=np.int64)
+        self.stalled_steps = np.zeros(n, dtype=np.int64)
+        self.progress = np.zeros((n, 2), dtype=np.int64)
+
+        if buf_obs is None:
+            buf_obs = np.zeros((n,) + self.observation_space.shape, dtype=self.observation_space.dtype)
+        self.buf_obs = buf_obs
+        self.opponent_buf_obs = np.zeros_like(buf_obs)
+        self.opponent = make_opponent(opponent)
+        self.actions = np.zeros(n, dtype=np.int64)
+        self.rows = np.arange(n)
+
+        if seed is not None:
+            self.seed(seed)
+
+    # Per game seeds are spawned from one seed sequence instead of seed + i
+    def seed(self, seed=None):
+        if seed is None:
+            seed = int(np.random.randint(0, np.iinfo(np.uint32).max, dtype=np.uint32))
+        self._seeds = spawn_seeds(seed, self.num_envs)
+        return self._seeds
+
+    def reset(self):
+        for i, seed in enumerate(self._seeds):
+            if seed is not None:
+                self.rngs[i] = np.random.default_rng(seed)
+        self._reset_seeds()
+        self._reset_options()
+
+        self._reset_games(self.rows)
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return self._get_observation(self.rows).copy()
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+
+    def step_wait(self):
+        rewards, dones, infos = self._step_games(self.actions)
+        return self.buf_obs.copy(), rewards.astype(np.float32), dones, infos
+
+    # Step every game, observations are left in buf_obs
+    def _step_games(self, actions):
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        infos = [{} for _ in range(self.num_envs)]
+
+        valid = self.agent_turn & (self.hands[self.rows, AGENT, actions] > 0)
+
+        # Out of turn or invalid ask, penalty and the opponent plays its turn
+        invalid = np.flatnonzero(~valid)
+        if invalid.size:
+            rewards[invalid] = -1.0
+            for i in invalid:
+                infos[i]["reason"] = "moved_out_of_turn" if not self.agent_turn[i] else "invalid_action"
+            self.agent_turn[invalid] = False
+            self._training_opponent_turn(invalid)
+            self.agent_turn[invalid] = True
+
+        asking = np.flatnonzero(valid)
+        if asking.size:
+            self._agent_ask(asking, actions[asking], rewards)
+
+        dones = self._game_over(self.rows)
+        truncated = self._check_truncation(dones, infos)
+        obs = self._get_observation(self.rows)
+
+        dones |= truncated
+        finished = np.flatnonzero(dones)
+        for i in finished:
+            infos[i]["terminal_observation"] = obs[i].copy()
+            infos[i]["TimeLimit.truncated"] = bool(truncated[i])
+        if finished.size:
+            self._reset_games(finished)
+            self._get_observation(finished)
+
+        return rewards, dones, infos
+
+    def _progress_marker(self, idx):
+        return np.column_stack([self.set_counts[idx, AGENT], self.hand_sizes[idx, AGENT]])
+
+    # Counts this step for every game, True where a game still running gets cut off
+    # The reason goes in info["truncation_reason"], same checks as GoFishEnv._check_truncation
+    def _check_truncation(self, dones, infos):
+        self.step_count += 1
+        progress = self._progress_marker(self.rows)
+        stalled = (progress[:, 0] == self.progress[:, 0]) & (progress[:, 1] <= self.progress[:, 1])
+        self.stalled_steps = np.where(stalled, self.stalled_steps + 1, 0)
+        self.progress[:] = progress
+
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        for limit, counter, reason in ((self.max_stalled_steps, self.stalled_steps, "no_progress"),
+                                       (self.max_steps, self.step_count, "max_steps")):
+            if limit is None:
+                continue
+            cut = (counter >= limit) & ~dones & ~truncated
+            for i in np.flatnonzero(cut):
+                infos[i]["truncation_reason"] = reason
+            truncated |= cut
+        return truncated
+
+    # Valid agent ask for each game in idx, same reward shaping as training_step
+    def _agent_ask(self, idx, actions, rewards):
+        self.turn_counter[idx] += 1
+
+        recent = (self.fail_ranks[idx] == actions[:, None]) & (self.turn_counter[idx, None] - self.fail_turns[idx] <= 5)
+        reward = 0.01 + -0.2 * recent.sum(axis=1)
+
+        prev_sets = self.set_counts[idx, AGENT].copy()
+        opp_hand_prev = self.hand_sizes[idx, OPPONENT].copy()
+        success = self._ask(idx, AGENT, actions)
+        self._update_sets(idx)
+
+        self.last_ask[idx, AGENT] = actions
+        self.last_ask_success[idx, AGENT] = success
+
+        self._check_empty_hand(idx)
+
+        new_sets = self.set_counts[idx, AGENT] - prev_sets
+        new_cards = opp_hand_prev - self.hand_sizes[idx, OPPONENT]
+        reward = np.where(success, reward + 0.3 * new_cards, reward)
+        reward = reward + new_sets
+        rewards[idx] = reward
+
+        # Agent goes again on success, game over needs no opponent turn
+        failed = ~success & ~self._game_over(idx)
+        idx = idx[failed]
+        if not idx.size:
+            return
+
+        head = self.fail_head[idx]
+        self.fail_ranks[idx, head] = actions[failed]
+        self.fail_turns[idx, head] = self.turn_counter[idx]
+        self.fail_head[idx] = (head + 1) % FAIL_MEMORY
+
+        drew = self._draw(idx, AGENT)
+        rewards[idx[drew]] -= 0.05
+        self.agent_turn[idx] = False
+
+        self._training_opponent_turn(idx)
+        self.agent_turn[idx] = True
+
+    # Opponent policy plays its turn in every game in idx, asking until it fails or runs out of cards
+    def _training_opponent_turn(self, idx):
+        active = idx[(self.hand_sizes[idx, OPPONENT] > 0) & ~self._game_over(idx)]
+        while active.size:
+            ranks = np.asarray(self.opponent.act(self, active), dtype=np.int64)
+
+            success = self._ask(active, OPPONENT, ranks)
+            self._update_sets(active)
+
+            self.last_ask[active, OPPONENT] = ranks
+            self.last_ask_success[active, OPPONENT] = success
+
+            self._check_empty_hand(active)
+
+            # Go fish from the bottom of the deck on a failed ask
+            self._draw(active[~success], OPPONENT, bottom=True)
+
+            active = active[success]
+            active = active[(self.hand_sizes[active, OPPONENT] > 0) & ~self._game_over(active)]
+
+    def set_opponent(self, opponent, **kwargs):
+        self.opponent = make_opponent(opponent, **kwargs)
+
+    # Move every card of ranks from the other player to player, True where cards moved
+    def _ask(self, idx, player, ranks):
+        other = 1 - player
+        moved = self.hands[idx, other, ranks].astype(np.int64)
+        self.hands[idx, player, ranks] += moved.astype(np.int8)
+        self.hands[idx, other, ranks] = 0
+        self.hand_sizes[idx, player] += moved
+        self.hand_sizes[idx, other] -= moved
+        return moved > 0
+
+    def _update_sets(self, idx):
+        full = self.hands[idx] == 4
+        if not full.any():
+            return
+        completed = full.sum(axis=2)
+        self.sets[idx] |= full
+        self.hands[idx] = np.where(full, 0, self.hands[idx])
+        self.set_counts[idx] += completed
+        self.hand_sizes[idx] -= 4 * completed
+
+    # Draw one card for each game in idx that still has a deck, returns which ones drew
+    def _draw(self, idx, player, bottom=False):
+        has_deck = self.deck_hi[idx] > self.deck_lo[idx]
+        idx = idx[has_deck]
+        if np.ndim(player):
+            player = player[has_deck]
+
+        if bottom:
+            cards = self.decks[idx, self.deck_lo[idx]]
+            self.deck_lo[idx] += 1
+        else:
+            self.deck_hi[idx] -= 1
+            cards = self.decks[idx, self.deck_hi[idx]]
+
+        self.hands[idx, player, cards] += 1
+        self.hand_sizes[idx, player] += 1
+        return has_deck
+
+    # Player whose turn it is draws if their hand is empty, turn passes if the deck is empty too
+    def _check_empty_hand(self, idx):
+        player = np.where(self.agent_turn[idx], AGENT, OPPONENT)
+        empty = self.hand_sizes[idx, player] == 0
+        has_deck = self.deck_hi[idx] > self.deck_lo[idx]
+
+        draw = empty & has_deck
+        self._draw(idx[draw], player[draw])
+
+        skip = idx[empty & ~has_deck]
+        self.agent_turn[skip] = ~self.agent_turn[skip]
+
+    def _game_over(self, idx):
+        return self.set_counts[idx].sum(axis=1) == NUM_RANKS
+
+    # Shuffle and deal fresh games, same draw order as GoFishEnv.reset
+    def _reset_games(self, idx):
+        # Opponents that track games (see GoFishLeague) see them before they're dealt again
+        if hasattr(self.opponent, "reset_games"):
+            self.opponent.reset_games(self, idx)
+
+        for i in idx:
+            rng = self.rngs[i]
+            deck = list(self.base_deck)
+            rng.shuffle(deck)
+            self.decks[i] = deck
+            self.coin_flip_result[i] = rng.integers(0, 2)
+
+        # Cards come off the top of the deck alternating, first card to whoever won the flip
+        dealt = self.decks[idx, 38:][:, ::-1]
+        agent_first = (self.coin_flip_result[idx] == 0)[:, None]
+        agent_cards = np.where(agent_first, dealt[:, 0::2], dealt[:, 1::2])
+        opponent_cards = np.where(agent_first, dealt[:, 1::2], dealt[:, 0::2])
+
+        self.hands[idx] = 0
+        np.add.at(self.hands, (idx[:, None], AGENT, agent_cards), 1)
+        np.add.at(self.hands, (idx[:, None], OPPONENT, opponent_cards), 1)
+        self.hand_sizes[idx] = 7
+        self.deck_lo[idx] = 0
+        self.deck_hi[idx] = 38
+
+        self.sets[idx] = False
+        self.set_counts[idx] = 0
+        self.agent_turn[idx] = self.coin_flip_result[idx] == 0
+        self.turn_counter[idx] = 0
+        self.last_ask[idx] = 13
+        self.last_ask_success[idx] = 0
+        self.fail_ranks[idx] = -1
+        self.fail_turns[idx] = 0
+        self.fail_head[idx] = 0
+        self.step_count[idx] = 0
+        self.stalled_steps[idx] = 0
+        self.progress[idx] = self._progress_marker(idx)
+
+    # Deal fresh games into idx, game idx[j] seeded with seeds[j] plays GoFishEnv().reset(seed=seeds[j])
+    def reseed_games(self, idx, seeds):
+        for i, seed in zip(idx, seeds):
+            self.rngs[i] = np.random.default_rng(seed)
+        self._reset_games(idx)
+        self._get_observation(idx)
+
+    # (agent, opponent) set counts read back from a flat observation, e.g. a terminal_observation
+    def observed_set_counts(self, obs):
+        off = self.offsets
+        agent = obs[off["agent_sets_completed"]:off["agent_sets_completed"] + NUM_RANKS + 1]
+        opponent = obs[off["opponent_sets_completed"]:off["opponent_sets_completed"] + NUM_RANKS + 1]
+        return int(agent.argmax()), int(opponent.argmax())
+
+    # One-hot encode the observation of every game in idx into buf_obs
+    def _get_observation(self, idx):
+        return self._write_observation(self.buf_obs, idx, AGENT, self.agent_turn[idx])
+
+    # Observations from the opponent's side, same flipped layout as GoFishEnv._get_opponent_observation
+    def opponent_observations(self, idx):
+        self._write_observation(self.opponent_buf_obs, idx, OPPONENT, 1)
+        return self.opponent_buf_obs[idx]
+
+    def _write_observation(self, obs, idx, player, is_turn):
+        off = self.offsets
+        other = 1 - player
+        obs[idx] = 0
+        rows = idx[:, None]
+
+        obs[rows, off["agent_hand_ranks"] + 5 * np.arange(NUM_RANKS) + self.hands[idx, player]] = 1
+        obs[idx, off["agent_sets_completed"] + self.set_counts[idx, player]] = 1
+        obs[idx, off["is_agent_turn"] + is_turn] = 1
+        obs[idx, off["last_agent_ask"] + self.last_ask[idx, player]] = 1
+        obs[idx, off["last_agent_ask_success"] + self.last_ask_success[idx, player]] = 1
+        obs[idx, off["last_opponent_ask"] + self.last_ask[idx, other]] = 1
+        obs[idx, off["last_opponent_ask_success"] + self.last_ask_success[idx, other]] = 1
+        obs[idx, off["opponent_hand_size"] + self.hand_sizes[idx, other]] = 1
+        obs[idx, off["opponent_sets_completed"] + self.set_counts[idx, other]] = 1
+        return obs
+
+    def close(self):
+        pass
+
+    # Arrays that make up the games, in the order get_state stores them
+    STATE_FIELDS = (
+        "decks", "deck_lo", "deck_hi", "hands", "hand_sizes", "sets", "set_counts",
+        "agent_turn", "coin_flip_result", "turn_counter", "last_ask", "last_ask_success",
+        "fail_ranks", "fail_turns", "fail_head", "step_count", "stalled_steps", "progress", "buf_obs",
+    )
+
+    # Copy of every game and its rng, enough for set_state to carry on exactly from here
+    # Arrays are per game along the first axis, so states from several batches can be concatenated
+    def get_state(self):
+        state = {name: getattr(self, name).copy() for name in self.STATE_FIELDS}
+        state["rngs"] = [rng.bit_generator.state for rng in self.rngs]
+        return state
+
+    def set_state(self, state):
+        for name in self.STATE_FIELDS:
+            getattr(self, name)[...] = state[name]
+        for rng, rng_state in zip(self.rngs, state["rngs"]):
+            rng.bit_generator.state = rng_state
+
+    # Ranks each agent can legally ask for, shape (num_envs, 13)
+    def action_masks(self):
+        masks = self.hands[:, AGENT] > 0
+        masks[~masks.any(axis=1)] = True
+        return masks
+
+    # The batch is a single object, attribute access applies to all games at once
+    # except for methods in batched_methods, which return one row per game
+    batched_methods = ("action_masks",)
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        if method_name in self.batched_methods:
+            return [result[i] for i in self._get_indices(indices)]
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
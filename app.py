@@ -1,30 +1,69 @@
 import streamlit as st
-import requests
 import random
 from PIL import Image
 from io import BytesIO
-from stable_baselines3 import PPO
-from gymnasium.wrappers import FlattenObservation
-from gymnasium.spaces.utils import flatten
+from GoFishPolicy import load_policy
 from GoFishEnv import GoFishEnv
+from GoFishSearch import SearchAgent, make_search_pool
+from GoFishEndgame import EndgameSolver
+from GoFishCards import make_deck_provider, compose_hand, card_jpeg, card_sort_key, CardState
+from GoFishState import AGENT, OPPONENT
 import time
+import base64
+
+# Model file for every difficulty that plays a trained network
+MODEL_PATHS = {"Easy": "GoFish_Model_easy", "Medium": "GoFish_Model_medium", "Hard": "GoFish_Model_hard"}
+
+# Load every model when the server starts instead of when the first game picks it
+WARM_MODELS = True
+
+# Load time and memory of each model loaded so far, one dict for the whole server
+@st.cache_resource
+def getModelStats():
+    return {}
+
+# Model registry, each difficulty is loaded once per server process and every session shares it
+# Policies only run forward passes, so games never write to the shared copy
+@st.cache_resource
+def loadModel(difficulty):
+    start = time.perf_counter()
+    model = load_policy(MODEL_PATHS[difficulty])
+    if hasattr(model, "arrays"):
+        memory = sum(array.nbytes for array in model.arrays)
+    else:
+        memory = sum(param.numel() * param.element_size() for param in model.policy.parameters())
+
+    stats = {"load_seconds": time.perf_counter() - start, "memory_bytes": memory}
+    getModelStats()[difficulty] = stats
+    print(f"Loaded {difficulty} model in {stats['load_seconds'] * 1000:.1f} ms, {memory / 1024:.1f} KB")
+    return model
+
+# The endgame table is read only as well, one copy for every Hard and Expert game
+@st.cache_resource
+def loadEndgameSolver():
+    return EndgameSolver()
 
-# Create and wrap environment
-env = GoFishEnv(mode='play')
+# Expert looks at EXPERT_WORLDS deals per move, capped at EXPERT_TIME_BUDGET seconds,
+# more worlds did not play any stronger against Hard
+EXPERT_WORLDS = 40
+EXPERT_TIME_BUDGET = 0.25
 
-# Function to get a new deck from deckofcardsapi
-def getDeck():
-    # Pull deck from website
-    url = "https://deckofcardsapi.com/api/deck/new/shuffle/?deck_count=1"
-    response = requests.get(url).json()
-    id = response['deck_id']
+# One worker pool for every Expert game on the server instead of one per session
+@st.cache_resource
+def getSearchPool():
+    return make_search_pool()
 
-    # Use a stack to store cards
-    draw_url = f"https://deckofcardsapi.com/api/deck/{id}/draw/?count=52"
-    draw_response = requests.get(draw_url).json()
-    deck_stack = draw_response['cards']
+if WARM_MODELS:
+    for difficulty in MODEL_PATHS:
+        loadModel(difficulty)
 
-    return deck_stack
+# Where decks come from, "local" shuffles and draws the cards here, "remote" uses deckofcardsapi.com
+DECK_PROVIDER = "local"
+deckProvider = make_deck_provider(DECK_PROVIDER)
+
+# Function to get a new shuffled deck, used as a stack
+def getDeck(seed=None):
+    return deckProvider.new_deck(seed)
 
 def fixFaces(value):
     if value == "ACE":
@@ -93,156 +132,245 @@ def getCoinFlipCards(deck, coin_flip_result):
 
     return player_card, opponent_card
 
-# Card dealing visual
-def deal(deck, coin_flip):
-    if not st.session_state.dealing_in_progress:
-        # st.session_state.remaining_deck = deck.copy()
-        st.session_state.player_hand = []
-        st.session_state.opponent_hand = []
-        st.session_state.cards_dealt = 0
-        st.session_state.dealing_in_progress = True
-
-    if st.session_state.cards_dealt < 14:
-        card = st.session_state.deck.pop()
-
-        # Player gets dealt to first 
-        if coin_flip == 0:
-            if st.session_state.cards_dealt % 2 == 0:
-                st.session_state.player_hand.append(card)
-            else:
-                st.session_state.opponent_hand.append(card)
-
-        # Opponent gets dealt to first 
-        else:
-            if st.session_state.cards_dealt % 2 == 0:
-                st.session_state.opponent_hand.append(card)
-            else:
-                st.session_state.player_hand.append(card)
-
-        st.session_state.cards_dealt += 1
-
-        if st.session_state.cards_dealt >= 14:
-            st.session_state.dealing_complete = True
-            st.session_state.env.agent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.player_hand]
-            st.session_state.env.opponent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand]
-
-    return st.session_state.cards_dealt >= 14
-
-def display_opponent_hand():
-    if st.session_state.opponent_hand:
+# Card dicts in a player's hand, read from the env's card state
+def handCards(player):
+    return st.session_state.env.state.hand_cards(player)
+
+# Display ranks of a player's completed sets, only the ones not in sets_before if given
+def setRanks(player, sets_before=0):
+    completed = st.session_state.env.state.sets_mask[player] & ~sets_before
+    return [convertRank(rank, "to_suit") for rank in range(13) if (completed >> rank) & 1]
+
+# Composited hand images, keyed by the cards shown, so a hand that hasn't changed since
+# the last rerun reuses the same png and the browser already has it cached
+@st.cache_data(max_entries=1024)
+def getHandImage(codes):
+    return compose_hand(codes)
+
+# Seconds between cards in the dealing animation
+DEAL_DELAY = 0.2
+
+# Card as an inline data uri for the dealing animation, None for the back
+@st.cache_data(max_entries=64)
+def getCardUri(code):
+    return "data:image/jpeg;base64," + base64.b64encode(card_jpeg(code)).decode()
+
+# A hand row dealt by the browser, every card slides in from the deck in the order the env dealt it
+# Cards start hidden and css delays reveal one every DEAL_DELAY seconds, so a single render plays the
+# whole deal and the server never sleeps or reruns, rows are laid out like compose_hand's
+def dealtRowHtml(codes, face_up, offset):
+    order = [card['code'] for _, card in st.session_state.env.state.draws[:14]]
+    cards = "".join(
+        f'<div class="dealt-card" style="animation-delay: {order.index(code) * DEAL_DELAY:.1f}s;'
+        f' background-image: {f"url({getCardUri(code)})" if face_up else "var(--card-back)"};"></div>'
+        for code in codes)
+    return f'''<style>
+@keyframes dealCard {{from {{opacity: 0; transform: translateY(var(--deal-from));}} to {{opacity: 1; transform: none;}}}}
+.dealt-row {{display: flex; justify-content: center; gap: 1.9%; --card-back: url({getCardUri(None)});}}
+.dealt-card {{width: 12.6%; aspect-ratio: 226 / 314; background-size: cover; animation: dealCard 0.3s ease-out both;}}
+</style><div class="dealt-row" style="--deal-from: {offset};">{cards}</div>'''
+
+def display_opponent_hand(animate=False):
+    opponent_hand = handCards(OPPONENT)
+    if opponent_hand:
         st.markdown("**Opponent's Hand**")
         
-        # Opponent's hand just uses card_back.png
-
-        #1 row total, 1 column per card, max at 7
-        cols = st.columns(7)
-
-        # Row spacing for opponent hand
-        hand_cards = min(7, len(st.session_state.opponent_hand))
-        start_col = (7-hand_cards) // 2
-
-        for each in range(hand_cards):
-            with cols[start_col + each]:
-                st.image('card_back.png', width=100)
+        # Opponent's hand is a single row of card backs, max at 7
+        hand_cards = min(7, len(opponent_hand))
+        if animate:
+            # Backs fly up from the deck below
+            codes = [card['code'] for card in opponent_hand]
+            st.markdown(dealtRowHtml(codes, False, "120px"), unsafe_allow_html=True)
+        else:
+            st.image(getHandImage((None,) * hand_cards), use_container_width=True)
 
         # Card count
-        st.markdown(f'*Cards: {len(st.session_state.opponent_hand)}*', unsafe_allow_html=True)
+        st.markdown(f'*Cards: {len(opponent_hand)}*', unsafe_allow_html=True)
 
 
-def display_player_hand():
-    if st.session_state.player_hand:
+def display_player_hand(animate=False):
+    player_hand = handCards(AGENT)
+    if player_hand:
         st.markdown("**Your Hand**")
-        # Using 7 cards per row
-        cards_per_row = 7
-        rows = (len(st.session_state.player_hand) + cards_per_row - 1) // cards_per_row
-
-        for row in range(rows):
-            start_idx = row * cards_per_row
-            end_idx = min(start_idx + cards_per_row, len(st.session_state.player_hand))
-            row_cards = st.session_state.player_hand[start_idx:end_idx]
 
-            # Always create exactly 7 columns for consistency
-            cols = st.columns(7)
-            
-            # Center the cards in this row
-            cards_in_row = len(row_cards)
-            start_col = (7 - cards_in_row) // 2
-            
-            for i, card in enumerate(row_cards):
-                with cols[start_col + i]:
-                    st.image(card['image'], width=100)
-                    st.markdown(f'<div style="text-align: center;"><em>{card["value"]}</em></div>', 
-                               unsafe_allow_html=True)
+        # Whole hand in one image, 7 cards per row and sorted so the same cards always make the same image
+        codes = tuple(sorted((card['code'] for card in player_hand), key=card_sort_key))
+        if animate:
+            # Dealt hands are 7 cards, one row coming down from the deck above
+            st.markdown(dealtRowHtml(codes, True, "-120px"), unsafe_allow_html=True)
+        else:
+            st.image(getHandImage(codes), use_container_width=True)
 
         # Card count below, centered
-        st.markdown(f'<div style="text-align: center;"><em>Cards: {len(st.session_state.player_hand)}</em></div>', 
+        st.markdown(f'<div style="text-align: center;"><em>Cards: {len(player_hand)}</em></div>', 
                    unsafe_allow_html=True)
 
-def check_and_remove_sets(hand, env_hand, player_name):
-    sets_completed = []
-    
-    # Count cards by rank
-    rank_counts = {}
-    for card in hand:
-        rank = convertRank(card['value'], 'to_env')
-        if rank not in rank_counts:
-            rank_counts[rank] = []
-        rank_counts[rank].append(card)
-    
-    # Find complete sets (4 cards)
-    updated_hand = hand.copy()
-    updated_env_hand = env_hand.copy()
-    
-    for rank, cards in rank_counts.items():
-        if len(cards) == 4:
-            # Remove all 4 cards from visual hand
-            for card in cards:
-                if card in updated_hand:
-                    updated_hand.remove(card)
-            
-            # Remove all 4 cards from environment hand
-            for _ in range(4):
-                if rank in updated_env_hand:
-                    updated_env_hand.remove(rank)
-            
-            # Record the completed set
-            display_rank = convertRank(rank, "to_suit")
-            sets_completed.append(display_rank)
-    
-    return updated_hand, updated_env_hand, sets_completed
-
 def check_game_end():
-    total_sets = len(st.session_state.get('player_sets', [])) + len(st.session_state.get('opponent_sets', []))
+    state = st.session_state.env.state
     
     # Game ends when all 13 sets are completed or both hands are empty
-    if total_sets >= 13 or (len(st.session_state.player_hand) == 0 and len(st.session_state.opponent_hand) == 0):
-      #  return True
+    if sum(state.set_counts) >= 13 or (state.hand_sizes[AGENT] == 0 and state.hand_sizes[OPPONENT] == 0):
         st.session_state.done=True
         return True
 
-    if len(st.session_state.get('player_sets', [])) >= 7 or len(st.session_state.get('opponent_sets', [])) >= 7:
+    if state.set_counts[AGENT] >= 7 or state.set_counts[OPPONENT] >= 7:
         st.session_state.done=True
         return True
     
     return False
 
 def display_set_completion(sets_completed, player_name):
-    if sets_completed:
-        for rank in sets_completed:
-            st.success(f"{player_name} completed a set of {rank}s! ")
+    for rank in sets_completed:
+        st.success(f"{player_name} completed a set of {rank}s! ")
+
+    
+
+# Continue buttons resolve a move, which changes the hands, scores and deck outside the fragment
+# The click only reruns the fragment and the branch that drew the button is usually gone by then,
+# so the callback leaves a flag and play_turn reruns the whole app for it
+def continueGame():
+    st.session_state.refresh_board = True
+
+# Action panel, the part of the board with buttons, as a fragment so picking a rank or
+# confirming only reruns this function instead of the whole script
+@st.fragment
+def play_turn():
+    if st.session_state.refresh_board:
+        st.session_state.refresh_board = False
+        st.rerun(scope="app")
+
+    env = st.session_state.env
+    state = env.state
+
+    if st.session_state.done == False:
+        # Ensure hands are playable, draws for whoever's turn it is if their hand is empty
+        env._check_empty_hand()
+
+        # Skip turn if hand is empty and no cards in deck
+        # I don't think either of these are actually reachable
+        if env.agent_turn and state.hand_sizes[AGENT] == 0 and len(env.deck) == 0:
+            env.agent_turn = False
+            st.info("Hand and deck are empty; turn skipped")
+            st.button("Continue", key="skip_turn_btn", on_click=continueGame)
+
+        if env.agent_turn == False and state.hand_sizes[OPPONENT] == 0 and len(env.deck) == 0:
+            env.agent_turn = True
+            st.info("Hand and deck are empty; turn skipped")
+            st.button("Continue", key="skip_turn_cpu_btn", on_click=continueGame)
+
+        if check_game_end():
+            st.rerun()
+
+        # Player's turn
+        if env.agent_turn:
+            # Rank counts come straight from the state
+            rank_counts = state.hands[AGENT]
+            player_shown = [rank for rank in range(13) if rank_counts[rank] > 0]
+
+            st.session_state.player_shown = player_shown
+
+            # Show legal moves if player has cards
+            if player_shown:
+                st.markdown("**Choose a rank to ask for:**")
+
+                cols = st.columns(len(player_shown))
+
+                for idx, rank in enumerate(player_shown):
+                    with cols[idx]:
+                        # Show the number of each rank
+                        count = int(rank_counts[rank])
+
+                        display = convertRank(rank, "to_suit")
+                        display = str(display) if isinstance(display, int) else display
+                                
+                        btn_lbl = f'{display}\n({count})'
+
+                        if st.button(btn_lbl, key=f'rank_{rank}',
+                                     type = "primary" if st.session_state.selected_rank == rank else "secondary"):
+                            st.session_state.selected_rank = rank
+
+                if st.session_state.selected_rank is not None:
+                    display = convertRank(st.session_state.selected_rank, "to_suit")
+                    display = str(display) if isinstance(display, int) else display
+                    st.markdown(f"**Selected:** Rank {display}")
         
-        # Add to session state for tracking
-        if "player_sets" not in st.session_state:
-            st.session_state.player_sets = []
-        if "opponent_sets" not in st.session_state:
-            st.session_state.opponent_sets = []
-            
-        if player_name == "You":
-            st.session_state.player_sets.extend(sets_completed)
+                    col1, col2, col3 = st.columns([1, 1, 1])
+                    
+                    with col2:
+                        if st.button("Confirm", key="confirm", type="primary"):
+                            # Ranks are the same in the buttons and the env
+                            action = st.session_state.selected_rank
+
+                            # Execute move, the env moves the cards, draws and removes sets in the state
+                            sets_before = state.sets_mask[AGENT]
+                            obs, reward, done, _, info = env.step(action)
+
+                            # See if ask was successful
+                            success = info.get("agent_success", False)
+
+                            # Any sets completed by taking cards from opponent or by the draw
+                            display_set_completion(setRanks(AGENT, sets_before), "You")
+
+                            if not success and check_game_end():
+                                st.rerun()
+
+                            # Reset selection
+                            st.session_state.selected_rank = None
+
+                            # Update game state
+                            st.session_state.done = done
+
+                            if success:
+                                st.success(f"Successful ask! You took all opponent's {display}s and go again.")
+                                st.button("Continue", key="cont_btn_after_successful_ask", on_click=continueGame)
+                            else:
+                                st.error(f"No {display}s. You drew a card. Opponent's turn.")
+                                st.button("Continue", key="cont_btn_after_failed_ask", on_click=continueGame)
+
+                else:
+                    st.info("Select a rank to ask for.")
+
+            else:
+                if check_game_end():
+                    st.rerun()
+
+        # Opponent turn
         else:
-            st.session_state.opponent_sets.extend(sets_completed)
+            sets_before = state.sets_mask[OPPONENT]
+            deck_before = len(env.deck)
+            obs, reward, done, _, info = env.step(0)
+            st.session_state.done = done
+
+            action = info.get("opponent_action", None)
+            success = info.get("opponent_success", False)
+
+            if action is not None:
+                translated_action = convertRank(action, "to_suit")
+                opponent_sets = setRanks(OPPONENT, sets_before)
+
+                if success:
+                    # Display set completion notification                     
+                    st.error(f"Opponent successfully took your {translated_action}s")
+                    display_set_completion(opponent_sets, "Opponent")
+                    
+                    st.button("Continue", key="cont_btn_after_info", on_click=continueGame)
+                else:
+                    # go fish if fail
+                    if deck_before:
+                        st.info(f"Opponent asked for {translated_action}s, but you had none. Opponent drew a card.")
+                        display_set_completion(opponent_sets, "Opponent")
+                        
+                        st.button("Continue", key="cont_btn_after_oppo", on_click=continueGame)
+
+                    else:
+                        st.info(f"Opponent asked for {translated_action}s, but you had none. No more cards to draw from.")
+                        display_set_completion(opponent_sets, "Opponent")
+                        st.button("Continue", key="cont_btn_after_info2", on_click=continueGame)
+                    
+
+            else:
+                st.error("Opponent had no legal move")
 
-    
 
 # Start streamlit app with default values
 if "validated" not in st.session_state:
@@ -265,20 +393,14 @@ if "dealing_complete" not in st.session_state:
     st.session_state.dealing_complete = False
 if "dealing_in_progress" not in st.session_state:
     st.session_state.dealing_in_progress = False
-if "player_hand" not in st.session_state:
-    st.session_state.player_hand = []
-if "opponent_hand" not in st.session_state:
-    st.session_state.opponent_hand = []
-if "remaining_deck" not in st.session_state:
-    st.session_state.remaining_deck = []
-if "cards_dealt" not in st.session_state:
-    st.session_state.cards_dealt = 0
 if "done" not in st.session_state:
     st.session_state.done = False
 if "selected_rank" not in st.session_state:
     st.session_state.selected_rank = None
 if "player_shown" not in st.session_state:
     st.session_state.player_shown = []
+if "refresh_board" not in st.session_state:
+    st.session_state.refresh_board = False
 
 
 # Pre-game landing screen
@@ -292,10 +414,12 @@ if not st.session_state.started:
     "<h3 style='text-align: center;'>Rules: <a href='https://bicyclecards.com/how-to-play/go-fish' target='_blank'>bicyclecards.com</a></h3>",
     unsafe_allow_html=True
     )
-    st.markdown(
-    "<h5 style='text-align: center;'>Credit for card images: <a href='https://deckofcardsapi.com' target='_blank'>deckofcardsapi.com</a></h5>",
-    unsafe_allow_html=True
-    )
+    # Local faces are drawn by GoFishCards.render_card, only the remote deck shows deckofcardsapi.com images
+    if DECK_PROVIDER == "remote":
+        st.markdown(
+        "<h5 style='text-align: center;'>Credit for card images: <a href='https://deckofcardsapi.com' target='_blank'>deckofcardsapi.com</a></h5>",
+        unsafe_allow_html=True
+        )
     st.markdown("<h6 style='text-align: center; '>Kyle Beach</h6>", unsafe_allow_html=True)
     
     # Set up columns for formatting
@@ -303,7 +427,7 @@ if not st.session_state.started:
 
     # Dropdown to select difficulty
     with col2:
-        st.session_state.difficulty = st.selectbox("Select Difficulty:", options=["Easy", "Medium", "Hard"], index=["Easy", "Medium", "Hard"].index(st.session_state.difficulty))
+        st.session_state.difficulty = st.selectbox("Select Difficulty:", options=["Easy", "Medium", "Hard", "Expert"], index=["Easy", "Medium", "Hard", "Expert"].index(st.session_state.difficulty))
 
         # Start game with start button
         if st.button("Begin Game"):
@@ -312,26 +436,37 @@ if not st.session_state.started:
             # Load deck, environment, and model depending on difficulty
             with st.spinner("Loading game..."):
                 st.session_state.deck = getDeck()
-                st.session_state.env = GoFishEnv(mode='play')
+                # The env plays on the deck's cards, so its hands are the ones on screen
+                st.session_state.env = GoFishEnv(mode='play', flat_obs=True, backend=CardState(st.session_state.deck))
 
                 # Set model depending on difficulty
                 if st.session_state.difficulty == "Easy":
-                    st.session_state.model = PPO.load("GoFish_Model_easy")
+                    st.session_state.model = loadModel("Easy")
                     st.session_state.env.reset()
                     st.session_state.coin_flip_result = st.session_state.env.coin_flip_result
                     st.session_state.env.set_model(st.session_state.model)
 
                 elif st.session_state.difficulty == "Medium":
-                    st.session_state.model = PPO.load("GoFish_Model_medium")
+                    st.session_state.model = loadModel("Medium")
                     st.session_state.env.reset()
                     st.session_state.coin_flip_result = st.session_state.env.coin_flip_result
                     st.session_state.env.set_model(st.session_state.model)
 
                 elif st.session_state.difficulty == "Hard":
-                    st.session_state.model = PPO.load("GoFish_Model_hard")
+                    st.session_state.model = loadModel("Hard")
                     st.session_state.env.reset()
                     st.session_state.coin_flip_result = st.session_state.env.coin_flip_result
                     st.session_state.env.set_model(st.session_state.model)
+                    st.session_state.env.set_endgame_solver(loadEndgameSolver())
+
+                # Expert searches over possible hidden hands each turn instead of using a network
+                elif st.session_state.difficulty == "Expert":
+                    st.session_state.model = SearchAgent(time_budget=EXPERT_TIME_BUDGET, max_worlds=EXPERT_WORLDS,
+                                                          pool=getSearchPool())
+                    st.session_state.env.reset()
+                    st.session_state.coin_flip_result = st.session_state.env.coin_flip_result
+                    st.session_state.env.set_model(st.session_state.model)
+                    st.session_state.env.set_endgame_solver(loadEndgameSolver())
             
             st.rerun()
 
@@ -394,48 +529,26 @@ if st.session_state.started and not st.session_state.game_ready:
 # Main gameplay  
 elif st.session_state.started and st.session_state.game_ready:
 
-    # Begin dealing
-    if not st.session_state.dealing_in_progress and not st.session_state.dealing_complete:
+    # Deal, the env dealt both hands on reset so the whole deal is known up front
+    # The first render of the board has the browser animate it, later reruns show the hands as images
+    if not st.session_state.dealing_complete:
+        st.session_state.dealing_complete = True
         st.session_state.dealing_in_progress = True
-        st.rerun()
-
-    # Dealing in progress
-    elif st.session_state.dealing_in_progress and not st.session_state.dealing_complete:
-
-        # Opponent hand at top
-        display_opponent_hand()
 
-        #st.markdown("---")
-        
-        col1, col2, col3 = st.columns([1, 1, 1])
-
-        with col2:
-            st.image('card_back.png', width=100)
-            st.markdown(f'*Deck Cards: {len(st.session_state.deck)}*')
-
-        #st.markdown("---")
-
-        display_player_hand()
-
-        if st.session_state.cards_dealt < 14:
-            time.sleep(0.2)
-            deal(st.session_state.deck, st.session_state.coin_flip_result)
-            st.rerun()
-
-    # Dealing is done, cards are on display and game can start 
-    elif st.session_state.dealing_complete:
+    # Cards are on display and game can start 
+    if st.session_state.dealing_complete:
         # Opponent hand in top row
-        display_opponent_hand()
+        display_opponent_hand(animate=st.session_state.dealing_in_progress)
 
         # keep track of sets
-        if st.session_state.get('player_sets') or st.session_state.get('opponent_sets'):
+        if any(st.session_state.env.state.set_counts):
             
             col1, col2, col3 = st.columns([1, 1, 1])
             with col1:
-                player_score = len(st.session_state.get('player_sets', []))
+                player_score = st.session_state.env.state.set_counts[AGENT]
                 st.markdown(f"**Your Sets: {player_score}**")
             with col3:
-                opponent_score = len(st.session_state.get('opponent_sets', []))
+                opponent_score = st.session_state.env.state.set_counts[OPPONENT]
                 st.markdown(f"**Opponent Sets: {opponent_score}**")
 
         # spacing
@@ -445,275 +558,35 @@ elif st.session_state.started and st.session_state.game_ready:
         
         with col2:
             st.image('card_back.png', width=100)
-            st.markdown(f'*Deck Cards: {len(st.session_state.deck)}*')
+            st.markdown(f'*Deck Cards: {len(st.session_state.env.deck)}*')
 
         st.markdown("---")
 
         # Player hand at the bottom
-        display_player_hand()
+        display_player_hand(animate=st.session_state.dealing_in_progress)
+        st.session_state.dealing_in_progress = False
     
 
         # Actual game starts 
-        base_env = st.session_state.env
-        env = FlattenObservation(base_env)
-
-        if st.session_state.done == False:
-            # Ensure hands are playable 
-            base_env._check_empty_hand()
-
-            # If player's hand or opponent's hand is empty and there is a deck, add a card
-            if len(st.session_state.player_hand) == 0:
-                if st.session_state.deck:
-                    st.session_state.player_hand.append(st.session_state.deck.pop())
-                    base_env.player_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.player_hand]
-
-            if len(st.session_state.opponent_hand) == 0:
-                if st.session_state.deck:
-                    st.session_state.opponent_hand.append(st.session_state.deck.pop())
-                    base_env.opponent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand]
-                
-                
-
-            # Skip turn if hand is empty and no cards in deck
-            # I don't think either of these are actually reachable
-            if base_env.agent_turn and len(st.session_state.player_hand) == 0 and len(st.session_state.deck) == 0:
-                base_env.agent_turn = False
-                st.info("Hand and deck are empty; turn skipped")
-                if st.button("Continue", key="skip_turn_btn"):
-                    st.rerun()
-
-            if base_env.agent_turn == False and len(st.session_state.opponent_hand) == 0 and len(st.session_state.deck) == 0:
-                base_env.agent_turn = True
-                st.info("Hand and deck are empty; turn skipped")
-                if st.button("Continue", key="skip_turn_cpu_btn"):
-                    st.rerun()
-
-            if check_game_end():
-                st.rerun()
-
-            # Player's turn
-            if base_env.agent_turn:
-                rank_counts = {}
-
-                for card in st.session_state.player_hand:
-                    rank = convertRank(card['value'], 'to_env')
-                    rank_counts[rank] = rank_counts.get(rank, 0) + 1
-                    
-                player_shown = [rank for rank, count in rank_counts.items() if count > 0]
-
-                st.session_state.player_shown = player_shown
-
-                # Show legal moves if player has cards
-                if player_shown:
-                    st.markdown("**Choose a rank to ask for:**")
-
-                    cols = st.columns(len(player_shown))
-
-                    for idx, rank in enumerate(player_shown):
-                        with cols[idx]:
-                            # Show the number of each rank
-                            # count = base_env.agent_hand.count(rank)
-                            # count = st.session_state.player_hand.count(rank)
-
-                            count = 0
-                            for card in st.session_state.player_hand:
-                                card_rank = convertRank(card['value'], "to_env")
-                                if card_rank == rank:
-                                    count += 1
-
-                            display = convertRank(rank, "to_suit")
-                            display = str(display) if isinstance(display, int) else display
-                                    
-                            btn_lbl = f'{display}\n({count})'
-
-                            if st.button(btn_lbl, key=f'rank_{rank}',
-                                         type = "primary" if st.session_state.selected_rank == rank else "secondary"):
-                                st.session_state.selected_rank = rank
-
-                    if st.session_state.selected_rank is not None:
-                        display = convertRank(st.session_state.selected_rank, "to_suit")
-                        display = str(display) if isinstance(display, int) else display
-                        st.markdown(f"**Selected:** Rank {display}")
-            
-                        col1, col2, col3 = st.columns([1, 1, 1])
-                        
-                        with col2:
-                            if st.button("Confirm", key="confirm", type="primary"):
-                                # Translate action from suit to env
-                                action = st.session_state.selected_rank
-                                # translated_action = convertRank(action, "to_env")
-                                translated_action = action
-
-                                # Execute move
-                                base_env.agent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.player_hand]
-                                base_env.opponent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand]
-                                obs, reward, done, _, info = env.step(translated_action)
-
-                                # See if ask was successful
-                                success = info.get("agent_success", False)
-
-                                # Successful ask and take cards from opponent
-                                if success:
-                                    moved_cards = []
-                                    remaining_opponent_hand = []
-                                    for card in st.session_state.opponent_hand:
-                                        card_rank_val = convertRank(card['value'], "to_env")
-
-                                        # Translated action is the requested rank
-                                        # Successful ask
-                                        if card_rank_val == translated_action:
-                                            moved_cards.append(card)
-
-                                        # Unsuccessful ask
-                                        else:
-                                            remaining_opponent_hand.append(card)
-
-                                    st.session_state.opponent_hand = remaining_opponent_hand
-                                    st.session_state.player_hand.extend(moved_cards)
-
-                                    # See if any sets were completed after taking cards from opponent
-                                    st.session_state.player_hand, updated_agent_hand, player_sets = check_and_remove_sets(st.session_state.player_hand, [convertRank(card['value'], 'to_env') for card in st.session_state.player_hand],"You")
-
-                                    display_set_completion(player_sets, "You")
-
-                                    
-                                    base_env.agent_hand = updated_agent_hand
-                                    base_env.opponent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand]
-                                        
-                                else:
-                                   if st.session_state.deck:
-                                       draw = st.session_state.deck.pop()
-                                       st.session_state.player_hand.append(draw)
-
-                                       base_env.agent_hand.append(convertRank(draw['value'], 'to_env'))
-
-                                       # See if any sets were completed after unsuccessful ask
-                                       st.session_state.player_hand, updated_agent_hand, player_sets = check_and_remove_sets(st.session_state.player_hand,[convertRank(card['value'], 'to_env') for card in st.session_state.player_hand],"You")
-                                       display_set_completion(player_sets, "You")
-                                       
-                                       if check_game_end():
-                                           st.rerun()
-
-                                # Reset selection
-                                st.session_state.selected_rank = None
-
-                                # Update game state
-                                st.session_state.done = done
-
-                                if success:
-                                    st.success(f"Successful ask! You took all opponent's {display}s and go again.")
-                                    if st.button("Continue", key="cont_btn_after_successful_ask"):
-                                        if check_game_end():
-                                            st.rerun()
-                                        st.rerun()
-                                else:
-                                    st.error(f"No {display}s. You drew a card. Opponent's turn.")
-                                    if st.button("Continue", key="cont_btn_after_failed_ask"):
-                                        if check_game_end():
-                                            st.rerun()
-                                        st.rerun()
-
-                    else:
-                        st.info("Select a rank to ask for.")
-
-                else:
-                    if check_game_end():
-                        st.rerun()
-
-            # Opponent turn
-            else:
-
-                base_env.agent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.player_hand]
-                base_env.opponent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand]
-                obs, reward, done, _, info = env.step(0)
-                st.session_state.done = done
-
-                action = info.get("opponent_action", None)
-                success = info.get("opponent_success", False)
-
-                if action is not None:
-                    translated_action = convertRank(action, "to_suit")
-
-                    if success:
-                        moved_cards = []
-                        remaining_player_hand = []
-
-                        # Compare env version of card to each suit card in player's hand
-                        for card in st.session_state.player_hand:
-                            card_rank_val = convertRank(card['value'], 'to_env')
-                            if card_rank_val == action:
-                                moved_cards.append(card)
-                            else:
-                                remaining_player_hand.append(card)
-
-                        st.session_state.player_hand = remaining_player_hand
-                        st.session_state.opponent_hand.extend(moved_cards)
-
-                        # Check for completed sets after opponent gets cards
-                        st.session_state.opponent_hand, updated_opponent_hand, opponent_sets = check_and_remove_sets(st.session_state.opponent_hand, [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand], "Opponent")
-
-                        base_env.agent_hand = [convertRank(card['value'], 'to_env') for card in st.session_state.player_hand]
-                        base_env.opponent_hand = updated_opponent_hand
-
-                        # Display set completion notification                     
-                        st.error(f"Opponent successfully took your {translated_action}s")
-                        display_set_completion(opponent_sets, "Opponent") # Add sets to list
-                        
-                        if st.button("Continue", key="cont_btn_after_info"):
-                            if check_game_end():
-                                st.rerun()
-                    else:
-                        # go fish if fail
-                        if st.session_state.deck:
-                            draw = st.session_state.deck.pop()
-                            st.session_state.opponent_hand.append(draw)
-
-                            # Check for completed sets after opponent draws
-                            st.session_state.opponent_hand, updated_opponent_hand, opponent_sets = check_and_remove_sets(st.session_state.opponent_hand, [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand], "Opponent")
-        
-                            base_env.opponent_hand = updated_opponent_hand
-        
-                            # Display set completion notification
-                            
-                            st.info(f"Opponent asked for {translated_action}s, but you had none. Opponent drew a card.")
-                            display_set_completion(opponent_sets, "Opponent") # Add sets to list
-                            
-                            st.session_state.opponent_hand, updated_opponent_hand, opponent_sets = check_and_remove_sets(st.session_state.opponent_hand, [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand], "Opponent")
-                            if st.button("Continue", key="cont_btn_after_oppo"):
-                                if check_game_end():
-                                    st.rerun()
-                                st.rerun()
-
-                        else:
-                            st.info(f"Opponent asked for {translated_action}s, but you had none. No more cards to draw from.")
-                            display_set_completion(opponent_sets, "Opponent")
-                            st.session_state.opponent_hand, updated_opponent_hand, opponent_sets = check_and_remove_sets(st.session_state.opponent_hand, [convertRank(card['value'], 'to_env') for card in st.session_state.opponent_hand], "Opponent")
-                            if st.button("Continue", key="cont_btn_after_info2"):
-                                if check_game_end():
-                                    st.rerun()
-                                st.rerun()
-                        
-
-                else:
-                    st.error("Opponent had no legal move")
+        play_turn()
 
         if st.session_state.done == True:
 
             st.markdown("Game Over")
 
-            player_score = len(st.session_state.get('player_sets', []))
-            opponent_score = len(st.session_state.get('opponent_sets', []))
+            player_score = st.session_state.env.state.set_counts[AGENT]
+            opponent_score = st.session_state.env.state.set_counts[OPPONENT]
     
             col1, col2 = st.columns(2)
             with col1:
                 st.markdown(f"**Your Sets:** {player_score}")
-                if st.session_state.get('player_sets'):
-                    st.write(", ".join(str(s) for s in st.session_state.player_sets))
+                if player_score:
+                    st.write(", ".join(str(s) for s in setRanks(AGENT)))
     
             with col2:
                 st.markdown(f"**Opponent Sets:** {opponent_score}")
-                if st.session_state.get('opponent_sets'):
-                    st.write(", ".join(str(s) for s in st.session_state.opponent_sets))
+                if opponent_score:
+                    st.write(", ".join(str(s) for s in setRanks(OPPONENT)))
     
             if player_score > opponent_score:
                 st.success("You Win!")
@@ -734,17 +607,14 @@ elif st.session_state.started and st.session_state.game_ready:
                 st.session_state.game_ready = False
                 st.session_state.dealing_complete = False
                 st.session_state.dealing_in_progress = False
-                st.session_state.player_hand = []
-                st.session_state.opponent_hand = []
-                st.session_state.remaining_deck = []
-                st.session_state.cards_dealt = 0
                 st.session_state.done = False
                 st.session_state.selected_rank = None
                 st.session_state.player_shown = []
-                st.session_state.player_sets = []
-                st.session_state.opponent_sets = []
+                st.session_state.refresh_board = False
                 st.session_state.deck = []
                 st.session_state.env = None
+                if hasattr(st.session_state.model, "close"):
+                    st.session_state.model.close()
                 st.session_state.model = None
                 st.session_state.coin_flip_result = None
                 st.rerun()
@@ -1,32 +1,105 @@
 # ChatGPT script with infinite loop guard
-from stable_baselines3 import PPO
-from gymnasium.wrappers import FlattenObservation
-from GoFishEnv import GoFishEnv
+import os
+import sys
+import json
+import time
+from math import log, sqrt
+from statistics import NormalDist
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from GoFishPolicy import load_policy
+from GoFishEnv import GoFishEnv, masked_predict, spawn_seeds
+from GoFishVecEnv import GoFishVecEnv
+from GoFishEndgame import EndgameSolver
+from GoFishOpponents import make_opponent
+from GoFishState import NUM_RANKS
 import numpy as np
 
 # === Config ===
+MODEL_PATH = "GoFish_Model_easy"
 NUM_GAMES = 10000
-SHOW_GAME_SUMMARY = True  # Set to False to disable per-game logs
-MAX_STEPS_PER_GAME = 500  # Safeguard to skip potential infinite loops
-
-# === Load model ===
-model = PPO.load("GoFish_Model_easy")
-
-# === Stats tracking ===
-wins = 0
-losses = 0
-ties = 0
-zero_games = 0
-skipped_games = 0
-
-for game in range(NUM_GAMES):
-    env = FlattenObservation(GoFishEnv())
-    obs, _ = env.reset()
-    done = False
+MAX_STEPS_PER_GAME = 500  # The env truncates games that run longer, they count as skipped
+MAX_STALLED_STEPS = 50  # Also truncate games stuck this many steps without a card moving
+USE_ACTION_MASKS = True  # Only let the model ask for ranks it holds
+SEED = 0  # Base seed, every game gets its own seed spawned from it
+USE_ENDGAME_SOLVER = False  # Play perfectly once the deck is empty instead of asking the model
+NUM_WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 1024  # Most games in one pool task, results stream in as chunks finish
+BATCH_SIZE = 256  # Games each worker plays in lockstep, one policy call per tick for the whole batch
+RESULTS = ("WIN", "LOSS", "TIE", "NO PROGRESS", "SKIPPED")
+
+# === Output ===
+REPORT_EVERY = 5.0  # Seconds between running progress lines
+REPORT_PATH = "evaluation_report.json"  # Final machine readable report, None to skip it
+RECORDS_PATH = None  # e.g. "evaluation_games.bin", one RECORD_DTYPE record per game, read back with np.fromfile
+
+# Per game record, result is an index into RESULTS
+# Results and sets are from MODEL_PATH's side, seat 1 games had it in the opponent seat
+RECORD_DTYPE = np.dtype([("game", "<u4"), ("seat", "u1"), ("result", "u1"), ("agent_sets", "u1"),
+                         ("opponent_sets", "u1"), ("steps", "<u2")])
+
+# === Early stopping ===
+# NUM_GAMES becomes a cap, games are played in rounds of CHECK_EVERY and the run stops after
+# the first round that settles the question, rounds are fixed so the stop doesn't depend on NUM_WORKERS
+CHECK_EVERY = 200
+TARGET_CI_WIDTH = None  # e.g. 0.03, stop once the win rate's confidence interval is this narrow
+CONFIDENCE = 0.95
+# Set to an older checkpoint to play MODEL_PATH against it and test "MODEL_PATH is better" with an SPRT
+# Every seed is then played from both seats, so seat advantage cancels out of p0 and NUM_GAMES counts
+# seeds (twice as many games)
+BASELINE_MODEL_PATH = None
+SPRT_P0 = 0.5  # Win rate if MODEL_PATH is no better
+SPRT_P1 = 0.55  # Win rate if MODEL_PATH is better
+SPRT_ALPHA = 0.05  # Chance of calling it better when it isn't
+SPRT_BETA = 0.05  # Chance of missing a real improvement
+
+# Loaded once per worker process by init_worker
+# swapped_env has the model in the opponent seat and baseline asking as the agent
+model = None
+baseline = None
+endgame_solver = None
+env = None
+swapped_env = None
+
+
+def init_worker(model_path, baseline_path=None):
+    global model, baseline, endgame_solver, env, swapped_env
+    # Exported NumPy policies skip torch, checkpoints without one load the full model
+    model = load_policy(model_path)
+    baseline = load_policy(baseline_path) if baseline_path else None
+
+    # One torch thread per process, the pool already uses every core
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(1)
+    # The solver reads a single GoFishEnv, so solver games are played one at a time
+    endgame_solver = EndgameSolver() if USE_ENDGAME_SOLVER else None
+    if baseline is None:
+        env = make_env("greedy")
+    else:
+        # The opponent seat samples its asks just like the agent does
+        env = make_env(make_opponent("ppo", model=baseline, deterministic=False))
+        swapped_env = make_env(make_opponent("ppo", model=model, deterministic=False))
+
+
+def make_env(opponent):
+    truncation = {"max_steps": MAX_STEPS_PER_GAME, "max_stalled_steps": MAX_STALLED_STEPS}
+    if USE_ENDGAME_SOLVER:
+        return GoFishEnv(flat_obs=True, opponent=opponent, **truncation)
+    return GoFishVecEnv(BATCH_SIZE, opponent=opponent, **truncation)
+
+
+# Play one game of agent on env with its own seed, returns the result and the final sets
+def play_game(game_seed, env, agent):
+    obs, _ = env.reset(seed=game_seed)
+    done = truncated = False
     step_count = 0
 
-    while not done:
-        action, _ = model.predict(obs)
+    while not (done or truncated):
+        # Sample actions from the game's own rng so results only depend on SEED
+        action = endgame_solver.best_ask(env, "agent") if endgame_solver is not None else None
+        if action is None:
+            mask = env.action_masks() if USE_ACTION_MASKS else None
+            action, _ = masked_predict(agent, obs, mask, rng=env.np_random)
 
         # Convert numpy array action to integer
         if isinstance(action, np.ndarray):
@@ -35,39 +108,290 @@ for game in range(NUM_GAMES):
         obs, reward, done, truncated, info = env.step(action)
         step_count += 1
 
-        if step_count >= MAX_STEPS_PER_GAME:
-            print(f"Game {game+1}: Skipped due to exceeding {MAX_STEPS_PER_GAME} steps.")
-            skipped_games += 1
-            break
+    if truncated:
+        return "SKIPPED", 0, 0, step_count
 
-    if step_count >= MAX_STEPS_PER_GAME:
-        continue  # Skip stats collection and move to next game
+    agent_sets = sum(env.agent_sets)
+    opponent_sets = sum(env.opponent_sets)
+    return game_result(agent_sets, opponent_sets), agent_sets, opponent_sets, step_count
 
-    agent_sets = sum(env.unwrapped.agent_sets)
-    opponent_sets = sum(env.unwrapped.opponent_sets)
 
+def game_result(agent_sets, opponent_sets):
     if agent_sets == 0 and opponent_sets == 0:
-        zero_games += 1
-        result = "NO PROGRESS"
+        return "NO PROGRESS"
     elif agent_sets > opponent_sets:
-        wins += 1
-        result = "WIN"
+        return "WIN"
     elif agent_sets < opponent_sets:
-        losses += 1
-        result = "LOSS"
+        return "LOSS"
+    return "TIE"
+
+
+# Play games in lockstep on the worker's GoFishVecEnv, a finished game's slot is dealt the
+# next seed right away so the batch stays full, yields (game, result, agent sets, opponent sets, steps)
+# Every game samples from its own rng, so each game plays out exactly as in play_game
+def play_batch(first_game, game_seeds, env, agent):
+    slot_games = np.full(env.num_envs, -1, dtype=np.int64)
+    steps = np.zeros(env.num_envs, dtype=np.int64)
+
+    started = min(env.num_envs, len(game_seeds))
+    env.reseed_games(np.arange(started), game_seeds[:started])
+    slot_games[:started] = np.arange(started)
+
+    actions = np.zeros(env.num_envs, dtype=np.int64)
+    while (slot_games >= 0).any():
+        # Idle slots left once the shard runs out of seeds are stepped but never read
+        active = np.flatnonzero(slot_games >= 0)
+        mask = env.action_masks()[active] if USE_ACTION_MASKS else None
+        rngs = [env.rngs[i] for i in active]
+        actions[active], _ = masked_predict(agent, env.buf_obs[active], mask, rng=rngs)
+
+        _, _, dones, infos = env.step(actions)
+        steps[active] += 1
+
+        finished = []
+        for i in active:
+            game = first_game + slot_games[i]
+            if not dones[i]:
+                continue
+            if infos[i]["TimeLimit.truncated"]:
+                yield game, "SKIPPED", 0, 0, int(steps[i])
+            else:
+                agent_sets, opponent_sets = env.observed_set_counts(infos[i]["terminal_observation"])
+                yield game, game_result(agent_sets, opponent_sets), agent_sets, opponent_sets, int(steps[i])
+            finished.append(i)
+
+        for i in finished:
+            if started < len(game_seeds):
+                env.reseed_games(np.array([i]), [game_seeds[started]])
+                slot_games[i] = started
+                steps[i] = 0
+                started += 1
+            else:
+                slot_games[i] = -1
+
+
+# Play a contiguous shard of games, returns their records in seat then game order
+# With a baseline each seed is played again with the seats swapped, those games are flipped to MODEL_PATH's side
+def play_shard(shard):
+    first_game, game_seeds = shard
+    seats = [(env, model)] if baseline is None else [(env, model), (swapped_env, baseline)]
+
+    records = np.zeros(len(seats) * len(game_seeds), dtype=RECORD_DTYPE)
+    for seat, (seat_env, agent) in enumerate(seats):
+        if endgame_solver is not None:
+            games = ((first_game + offset, *play_game(game_seed, seat_env, agent))
+                     for offset, game_seed in enumerate(game_seeds))
+        else:
+            games = play_batch(first_game, game_seeds, seat_env, agent)
+
+        for game, result, agent_sets, opponent_sets, step_count in games:
+            if seat == 1:
+                result = {"WIN": "LOSS", "LOSS": "WIN"}.get(result, result)
+                agent_sets, opponent_sets = opponent_sets, agent_sets
+            records[seat * len(game_seeds) + game - first_game] = (
+                game, seat, RESULTS.index(result), agent_sets, opponent_sets, step_count)
+    return records
+
+
+# Running totals over the streamed records, small enough to print or dump at any point
+class EvaluationStats:
+    def __init__(self):
+        self.counts = dict.fromkeys(RESULTS, 0)
+        # margins[m + 13] counts finished games won by m sets, lengths[s] games that took s steps
+        self.margins = np.zeros(2 * NUM_RANKS + 1, dtype=np.int64)
+        self.lengths = np.zeros(MAX_STEPS_PER_GAME + 1, dtype=np.int64)
+        self.played = 0
+        self.steps = 0
+        self.start_time = time.perf_counter()
+
+    def add(self, records):
+        for result, count in zip(RESULTS, np.bincount(records["result"], minlength=len(RESULTS))):
+            self.counts[result] += int(count)
+        finished = records[records["result"] != RESULTS.index("SKIPPED")]
+        margins = finished["agent_sets"].astype(np.int64) - finished["opponent_sets"] + NUM_RANKS
+        self.margins += np.bincount(margins, minlength=len(self.margins))
+        self.lengths += np.bincount(np.minimum(records["steps"], MAX_STEPS_PER_GAME), minlength=len(self.lengths))
+        self.played += len(records)
+        self.steps += int(records["steps"].sum())
+
+    def elapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def win_rate(self):
+        decided = self.played - self.counts["SKIPPED"]
+        return self.counts["WIN"] / decided if decided else None
+
+    # Step count below which the given fraction of games finished
+    def length_percentile(self, fraction):
+        cumulative = np.cumsum(self.lengths)
+        return int(np.searchsorted(cumulative, fraction * cumulative[-1])) if cumulative[-1] else 0
+
+    def progress_line(self, num_games):
+        rate = self.win_rate()
+        parts = [f"{self.played}/{num_games} games",
+                 f"W-L-T {self.counts['WIN']}-{self.counts['LOSS']}-{self.counts['TIE']}",
+                 f"win rate {rate:.2%}" if rate is not None else "win rate N/A",
+                 f"{self.steps / self.elapsed():.0f} steps/s"]
+        return " | ".join(parts)
+
+    def report(self, reason=None):
+        wins, losses = self.counts["WIN"], self.counts["LOSS"]
+        ties = self.counts["TIE"] + self.counts["NO PROGRESS"]
+        low, high = wilson_interval(wins, self.played - self.counts["SKIPPED"])
+        elapsed = self.elapsed()
+        report = {
+            "model": MODEL_PATH,
+            "opponent": BASELINE_MODEL_PATH or "greedy",
+            "seed": SEED,
+            "games": self.played,
+            "max_games": NUM_GAMES * (2 if BASELINE_MODEL_PATH is not None else 1),
+            "counts": self.counts,
+            "win_rate": self.win_rate(),
+            "confidence_interval": {"confidence": CONFIDENCE, "low": low, "high": high},
+            "stop_reason": reason,
+            "set_margins": {str(margin - NUM_RANKS): int(count) for margin, count in enumerate(self.margins) if count},
+            "game_length": {
+                "mean": self.steps / self.played if self.played else None,
+                "p50": self.length_percentile(0.5),
+                "p90": self.length_percentile(0.9),
+                "p99": self.length_percentile(0.99),
+                "max": int(np.flatnonzero(self.lengths).max()) if self.played else None,
+                "histogram": {str(steps): int(count) for steps, count in enumerate(self.lengths) if count},
+            },
+            "elapsed_seconds": elapsed,
+            "games_per_second": self.played / elapsed,
+            "steps_per_second": self.steps / elapsed,
+        }
+        if BASELINE_MODEL_PATH is not None:
+            lower, upper = sprt_bounds()
+            report["sprt"] = {"p0": SPRT_P0, "p1": SPRT_P1, "llr": sprt_llr(wins, losses, ties), "lower": lower, "upper": upper}
+        return report
+
+
+# Wilson score interval for a win rate, stays sensible near 0 and 1 and for few games
+def wilson_interval(wins, games, confidence=CONFIDENCE):
+    if not games:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    rate = wins / games
+    scale = 1 + z * z / games
+    center = (rate + z * z / (2 * games)) / scale
+    spread = z * sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / scale
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+# Log likelihood ratio of win rate p1 against p0, ties count half a win
+def sprt_llr(wins, losses, ties, p0=SPRT_P0, p1=SPRT_P1):
+    return (wins + ties / 2) * log(p1 / p0) + (losses + ties / 2) * log((1 - p1) / (1 - p0))
+
+
+# Wald's bounds, the test accepts p0 below the lower one and p1 above the upper one
+def sprt_bounds(alpha=SPRT_ALPHA, beta=SPRT_BETA):
+    return log(beta / (1 - alpha)), log((1 - beta) / alpha)
+
+
+# Why the counts so far are enough to stop, None to keep playing
+def stop_reason(counts, baseline_path=BASELINE_MODEL_PATH, target_width=TARGET_CI_WIDTH, model_path=MODEL_PATH):
+    wins = counts["WIN"]
+    losses = counts["LOSS"]
+    ties = counts["TIE"] + counts["NO PROGRESS"]
+
+    if baseline_path is not None:
+        llr = sprt_llr(wins, losses, ties)
+        lower, upper = sprt_bounds()
+        if llr >= upper:
+            return f"SPRT: {model_path} is better than {baseline_path}"
+        if llr <= lower:
+            return f"SPRT: {model_path} is not better than {baseline_path}"
+
+    if target_width is not None:
+        low, high = wilson_interval(wins, wins + losses + ties)
+        if high - low <= target_width:
+            return f"Confidence interval narrower than {target_width:.2%}"
+    return None
+
+
+# Per-game seeds are spawned from SEED up front, so results don't depend on NUM_WORKERS
+# Returns the EvaluationStats of the games played and why the run stopped early (or None)
+def evaluate(model_path=MODEL_PATH, num_games=NUM_GAMES, num_workers=NUM_WORKERS, baseline_path=BASELINE_MODEL_PATH,
+             target_width=TARGET_CI_WIDTH, records_path=RECORDS_PATH):
+    game_seeds = spawn_seeds(SEED, num_games)
+    num_workers = max(1, min(num_workers, num_games))
+    sequential = baseline_path is not None or target_width is not None
+    seats = 2 if baseline_path is not None else 1
+    round_size = CHECK_EVERY if sequential else num_games
+
+    pool = None
+    if num_workers == 1:
+        init_worker(model_path, baseline_path)
     else:
-        ties += 1
-        result = "TIE"
-
-    if SHOW_GAME_SUMMARY:
-        print(f"Game {game+1}: {result} (Agent: {agent_sets}, Opponent: {opponent_sets}, Steps: {step_count})")
-
-# === Final Report ===
-print("\n=== Evaluation Summary ===")
-print(f"Total Games Attempted: {NUM_GAMES}")
-print(f"Wins:                  {wins}")
-print(f"Losses:                {losses}")
-print(f"Ties:                  {ties}")
-print(f"No Progress Games:     {zero_games}")
-print(f"Skipped Games:         {skipped_games}")
-print(f"Win Rate:              {wins / (NUM_GAMES - skipped_games):.2%}" if NUM_GAMES != skipped_games else "Win Rate: N/A")
+        method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        pool = ProcessPoolExecutor(num_workers, mp_context=mp.get_context(method),
+                                   initializer=init_worker, initargs=(model_path, baseline_path))
+
+    stats = EvaluationStats()
+    records_file = open(records_path, "wb") if records_path is not None else None
+    last_report = time.perf_counter()
+    played = 0
+    reason = None
+    try:
+        while played < num_games and reason is None:
+            # Chunks small enough to keep every worker busy, map hands them back in game order
+            round_end = min(played + round_size, num_games)
+            chunk = min(CHUNK_SIZE, -(-(round_end - played) // num_workers))
+            shards = [(start, game_seeds[start:min(start + chunk, round_end)]) for start in range(played, round_end, chunk)]
+            shard_results = pool.map(play_shard, shards) if pool is not None else map(play_shard, shards)
+
+            for records in shard_results:
+                stats.add(records)
+                if records_file is not None:
+                    records.tofile(records_file)
+                if time.perf_counter() - last_report >= REPORT_EVERY:
+                    print(stats.progress_line(num_games * seats), flush=True)
+                    last_report = time.perf_counter()
+            played = round_end
+            reason = stop_reason(stats.counts, baseline_path, target_width, model_path) if sequential else None
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if records_file is not None:
+            records_file.close()
+    return stats, reason
+
+
+if __name__ == "__main__":
+    stats, reason = evaluate()
+    counts = stats.counts
+    played = stats.played
+    report = stats.report(reason)
+    wins = counts["WIN"]
+    losses = counts["LOSS"]
+    ties = counts["TIE"]
+    zero_games = counts["NO PROGRESS"]
+    skipped_games = counts["SKIPPED"]
+
+    # === Final Report ===
+    print("\n=== Evaluation Summary ===")
+    print(f"Total Games Attempted: {played}")
+    print(f"Wins:                  {wins}")
+    print(f"Losses:                {losses}")
+    print(f"Ties:                  {ties}")
+    print(f"No Progress Games:     {zero_games}")
+    print(f"Skipped Games:         {skipped_games}")
+    print(f"Win Rate:              {wins / (played - skipped_games):.2%}" if played != skipped_games else "Win Rate: N/A")
+    low, high = wilson_interval(wins, played - skipped_games)
+    print(f"{CONFIDENCE:.0%} Interval:          {low:.2%} - {high:.2%}")
+    if BASELINE_MODEL_PATH is not None:
+        lower, upper = sprt_bounds()
+        llr = sprt_llr(wins, losses, ties + zero_games)
+        print(f"SPRT LLR:              {llr:.2f} (bounds {lower:.2f}, {upper:.2f})")
+    print(f"Stopped Early:         {reason}" if reason is not None else f"Stopped Early:         No, reached {NUM_GAMES} games")
+    length = report["game_length"]
+    print(f"Game Length:           mean {length['mean']:.1f}, median {length['p50']}, p99 {length['p99']} steps")
+    print(f"Games per Second:      {report['games_per_second']:.1f}")
+    print(f"Steps per Second:      {report['steps_per_second']:.0f}")
+
+    if REPORT_PATH is not None:
+        with open(REPORT_PATH, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {REPORT_PATH}")
@@ -1,17 +1,15 @@
-from stable_baselines3 import PPO
-from gymnasium.wrappers import FlattenObservation
-from gymnasium.spaces.utils import flatten
+from GoFishPolicy import load_policy
 from GoFishEnv import GoFishEnv
 
 RANK_LABELS = [str(i) for i in range(13)]  # '0' to '12'
 
 # Load the trained model
-model = PPO.load("GoFish_Model")
+model = load_policy("GoFish_Model")
 
-# Create and wrap the environment
-base_env = GoFishEnv(mode="play")
+# Create the environment, flat observations go straight to the model
+base_env = GoFishEnv(mode="play", flat_obs=True)
 base_env.set_model(model)
-env = FlattenObservation(base_env)
+env = base_env
 
 obs, _ = env.reset()
 done = False
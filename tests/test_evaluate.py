@@ -0,0 +1,26 @@
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import evaluate
+
+
+# The SPRT's p0 of 0.5 only holds if seat advantage cancels out, so against a baseline every seed
+# is played from both seats, a model against itself then scores exactly even
+def test_baseline_games_play_both_seats(tmp_path):
+    model_path = os.path.join(ROOT, "GoFish_Model_hard")
+    records_path = str(tmp_path / "records.bin")
+    stats, reason = evaluate.evaluate(model_path=model_path, num_games=200, num_workers=1,
+                                      baseline_path=model_path, records_path=records_path)
+    records = np.fromfile(records_path, dtype=evaluate.RECORD_DTYPE)
+
+    assert stats.played == 2 * 200
+    assert np.array_equal(np.bincount(records["seat"]), [200, 200])
+    for seat in (0, 1):
+        assert np.array_equal(np.sort(records["game"][records["seat"] == seat]), np.arange(200))
+    assert stats.counts["WIN"] == stats.counts["LOSS"]
+    assert stats.win_rate() == 0.5
@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sb3_contrib import MaskablePPO
+
+from GoFishModels import policy_arrays
+from GoFishPolicy import NumpyPolicy
+from GoFishTraining import DEFAULT_CONFIG, evaluate_arrays, milestone_tiers, win_rate
+from GoFishVecEnv import GoFishVecEnv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Win rate of arrays under the training evaluation settings, None is the random legal baseline
+def evaluate(arrays, deterministic=False):
+    config = DEFAULT_CONFIG
+    return win_rate(evaluate_arrays(arrays, config["eval_games"], config["eval_seed"], config["eval_opponent"],
+                                    deterministic, config["max_steps_per_game"], config["max_stalled_steps"]))
+
+
+# Masked asks make random play strong, an actor that hasn't trained must not pass for a tier model
+def test_untrained_policy_emits_no_tier():
+    baseline = evaluate(None)
+    for seed in range(3):
+        model = MaskablePPO("MlpPolicy", GoFishVecEnv(4, seed=seed), seed=seed)
+        arrays = policy_arrays(model)
+        for deterministic in (False, True):
+            assert milestone_tiers(DEFAULT_CONFIG["milestones"], baseline, evaluate(arrays, deterministic)) == []
+
+
+def test_trained_policy_reaches_a_tier():
+    baseline = evaluate(None)
+    arrays = NumpyPolicy.load(os.path.join(ROOT, "GoFish_Model_hard.npz")).arrays
+    assert "easy" in milestone_tiers(DEFAULT_CONFIG["milestones"], baseline, evaluate(arrays))
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import numpy as np
+from gymnasium.spaces.utils import flatten
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GoFishEnv import GoFishEnv
+
+
+# Flat observations are written straight into a buffer, they have to be exactly the Dict
+# observation flattened, from both seats, since app.py and play_opponent_turn no longer flatten
+def test_flat_obs_match_flattened_dict_obs():
+    for backend in ("list", "counts"):
+        dict_env = GoFishEnv(backend=backend)
+        flat_env = GoFishEnv(backend=backend, flat_obs=True)
+        space = dict_env.observation_space
+        assert flat_env.observation_space.shape == (flatten(space, space.sample()).size,)
+
+        rng = np.random.default_rng(0)
+        games = 0
+        dict_obs, _ = dict_env.reset(seed=games)
+        flat_obs, _ = flat_env.reset(seed=games)
+        for _ in range(500):
+            assert np.array_equal(flatten(space, dict_obs), flat_obs)
+            assert np.array_equal(flatten(space, dict_env._get_opponent_observation()),
+                                  flat_env._get_opponent_observation())
+
+            action = int(rng.integers(13))
+            dict_obs, _, terminated, truncated, _ = dict_env.step(action)
+            flat_obs, _, _, _, _ = flat_env.step(action)
+            if terminated or truncated:
+                games += 1
+                dict_obs, _ = dict_env.reset(seed=games)
+                flat_obs, _ = flat_env.reset(seed=games)
+        assert games > 0
@@ -0,0 +1,83 @@
+import os
+import sys
+
+import numpy as np
+import torch
+from sb3_contrib import MaskablePPO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GoFishEnv import masked_predict
+from GoFishModels import SHIPPED_MODELS, export_policy, load_model, policy_arrays
+from GoFishPolicy import NumpyPolicy
+from GoFishVecEnv import GoFishVecEnv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Flat observations and action masks from seeded games played with random held ranks
+def sample_observations(steps=50):
+    env = GoFishVecEnv(16, seed=0)
+    obs = env.reset()
+    rng = np.random.default_rng(0)
+    all_obs, all_masks = [], []
+    for _ in range(steps):
+        masks = env.action_masks()
+        all_obs.append(obs.copy())
+        all_masks.append(masks.copy())
+        logits = np.where(masks, rng.gumbel(size=masks.shape), -np.inf)
+        obs, _, _, _ = env.step(logits.argmax(axis=1))
+    return np.concatenate(all_obs), np.concatenate(all_masks)
+
+
+def shipped_path(name, extension):
+    name = name[:-4] if name.endswith(".zip") else name
+    return os.path.join(ROOT, name + extension)
+
+
+def log_softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    return logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+
+
+def check_matches_torch(model, policy, obs, masks):
+    with torch.no_grad():
+        obs_tensor, _ = model.policy.obs_to_tensor(obs)
+        torch_logits = model.policy.get_distribution(obs_tensor).distribution.logits.cpu().numpy()
+    assert np.allclose(log_softmax(policy.logits(obs)), torch_logits, atol=1e-4)
+
+    for mask in (None, masks):
+        for deterministic in (True, False):
+            torch_actions, _ = masked_predict(model, obs, mask, deterministic, rng=np.random.default_rng(1))
+            numpy_actions, _ = masked_predict(policy, obs, mask, deterministic, rng=np.random.default_rng(1))
+            assert np.array_equal(torch_actions, numpy_actions)
+
+
+# The app serves the .npz files without torch, they have to be the shipped checkpoints' actors
+def test_shipped_npz_match_export(tmp_path):
+    for name in SHIPPED_MODELS:
+        shipped = NumpyPolicy.load(shipped_path(name, ".npz"))
+        exported = export_policy(shipped_path(name, ".zip"), str(tmp_path / "policy.npz"))
+        assert shipped.activation == exported.activation
+        assert len(shipped.arrays) == len(exported.arrays)
+        for shipped_array, exported_array in zip(shipped.arrays, exported.arrays):
+            assert np.array_equal(shipped_array, exported_array)
+
+
+def test_numpy_policy_matches_shipped_torch_actors():
+    obs, masks = sample_observations()
+    for name in SHIPPED_MODELS:
+        model = load_model(shipped_path(name, ".zip"))
+        check_matches_torch(model, NumpyPolicy.load(shipped_path(name, ".npz")), obs, masks)
+
+
+# MaskablePPO applies the mask inside its distribution, the masked argmax has to agree with it
+def test_numpy_policy_matches_maskable_actor():
+    obs, masks = sample_observations()
+    model = MaskablePPO("MlpPolicy", GoFishVecEnv(4, seed=0), seed=0)
+    policy = NumpyPolicy(policy_arrays(model), model.policy.activation_fn.__name__.lower())
+    check_matches_torch(model, policy, obs, masks)
+
+    actions, _ = model.predict(obs, deterministic=True, action_masks=masks)
+    assert np.array_equal(actions, masked_predict(policy, obs, masks, deterministic=True)[0])
+    assert masks[np.arange(len(actions)), actions].all()
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GoFishEnv import GoFishEnv
+from GoFishPolicy import NumpyPolicy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_env(mode, backend):
+    env = GoFishEnv(mode=mode, backend=backend, flat_obs=True, max_steps=300, max_stalled_steps=30)
+    # Play mode's opponent is the deterministic hard policy, so restored games play the same asks
+    if mode == "play":
+        env.set_model(NumpyPolicy.load(os.path.join(ROOT, "GoFish_Model_hard.npz")))
+    return env
+
+
+def held_rank(env, rng):
+    held = np.flatnonzero(env._hand_counts("agent"))
+    return int(held[rng.integers(held.size)]) if held.size else 0
+
+
+def test_get_state_before_reset_raises():
+    with pytest.raises(RuntimeError):
+        GoFishEnv().get_state()
+
+
+# A game saved mid-way and restored into a fresh env carries on exactly like the original
+def test_state_round_trips_mid_game():
+    for mode in ("train", "play"):
+        for backend in ("list", "counts"):
+            rng = np.random.default_rng(0)
+            env = make_env(mode, backend)
+            env.reset(seed=1)
+            for _ in range(15):
+                env.step(held_rank(env, rng))
+            state = env.get_state()
+
+            restored = make_env(mode, backend)
+            restored.reset(seed=2)
+            restored.set_state(state)
+            assert restored.get_state() == state
+            assert np.array_equal(restored._get_observation(), env._get_observation())
+
+            for _ in range(300):
+                action = held_rank(env, rng)
+                obs, reward, terminated, truncated, info = env.step(action)
+                restored_obs, restored_reward, restored_terminated, restored_truncated, _ = restored.step(action)
+                assert np.array_equal(obs, restored_obs)
+                assert (reward, terminated, truncated) == (restored_reward, restored_terminated, restored_truncated)
+                assert restored.get_state() == env.get_state()
+                if terminated or truncated:
+                    break
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GoFishEnv import GoFishEnv
+from GoFishVecEnv import GoFishVecEnv
+from GoFishState import AGENT
+
+
+# A policy that keeps asking for a rank it doesn't hold never gains a card or completes a set,
+# so the game has to be cut off by max_stalled_steps even though the opponent keeps playing
+def test_invalid_asks_truncate_env():
+    for backend in ("list", "counts"):
+        env = GoFishEnv(backend=backend, max_stalled_steps=10)
+        env.reset(seed=0)
+        for step in range(200):
+            invalid = [rank for rank in range(13) if env.agent_hand.count(rank) == 0][0]
+            obs, reward, terminated, truncated, info = env.step(invalid)
+            assert info.get("reason") == "invalid_action"
+            if terminated or truncated:
+                break
+        assert truncated and not terminated
+        assert info["truncation_reason"] == "no_progress"
+        assert step == 9
+
+
+def test_invalid_asks_truncate_vec_env():
+    venv = GoFishVecEnv(num_envs=4, seed=0, max_stalled_steps=10)
+    venv.reset()
+    for step in range(200):
+        actions = np.argmin(venv.hands[:, AGENT], axis=1)
+        obs, rewards, dones, infos = venv.step(actions)
+        if dones.any():
+            break
+    assert dones.all() and step == 9
+    assert all(info["truncation_reason"] == "no_progress" for info in infos)
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from GoFishEnv import GoFishEnv, spawn_seeds
+from GoFishSharedVecEnv import GoFishSharedVecEnv
+from GoFishState import AGENT
+from GoFishVecEnv import GoFishVecEnv
+
+NUM_GAMES = 4
+SEED = 7
+STEPS = 400
+
+
+# Mostly held ranks with some invalid asks, the same actions go to every env
+def make_actions(rng, hands):
+    actions = rng.integers(13, size=len(hands))
+    for i, hand in enumerate(hands):
+        held = np.flatnonzero(hand)
+        if held.size and rng.random() < 0.8:
+            actions[i] = held[rng.integers(held.size)]
+    return actions
+
+
+# Game i of a vec env seeded with SEED replays GoFishEnv reset with spawn_seeds(SEED, n)[i],
+# including the games the vec env starts in place after one finishes
+def test_vec_env_matches_single_envs():
+    for backend in ("list", "counts"):
+        venv = GoFishVecEnv(NUM_GAMES, seed=SEED, max_steps=200, max_stalled_steps=20)
+        envs = [GoFishEnv(backend=backend, flat_obs=True, max_steps=200, max_stalled_steps=20)
+                for _ in range(NUM_GAMES)]
+        obs = venv.reset()
+        for env, seed, game_obs in zip(envs, spawn_seeds(SEED, NUM_GAMES), obs):
+            assert np.array_equal(env.reset(seed=seed)[0], game_obs)
+
+        rng = np.random.default_rng(0)
+        for _ in range(STEPS):
+            actions = make_actions(rng, np.array([env._hand_counts("agent") for env in envs]))
+            obs, rewards, dones, infos = venv.step(actions)
+            for i, env in enumerate(envs):
+                game_obs, reward, terminated, truncated, info = env.step(int(actions[i]))
+                assert reward == rewards[i]
+                assert (terminated or truncated) == dones[i]
+                assert info.get("reason") == infos[i].get("reason")
+                if dones[i]:
+                    assert truncated == infos[i]["TimeLimit.truncated"]
+                    assert np.array_equal(game_obs, infos[i]["terminal_observation"])
+                    game_obs, _ = env.reset()
+                assert np.array_equal(game_obs, obs[i])
+
+
+# The shared memory env runs GoFishVecEnv blocks in worker processes, it has to give the same games
+def test_shared_vec_env_matches_vec_env():
+    venv = GoFishVecEnv(NUM_GAMES, seed=SEED, max_steps=200, max_stalled_steps=20)
+    shared = GoFishSharedVecEnv(NUM_GAMES, num_workers=2, seed=SEED, max_steps=200, max_stalled_steps=20)
+    try:
+        assert np.array_equal(venv.reset(), shared.reset())
+        rng = np.random.default_rng(0)
+        for _ in range(STEPS):
+            actions = make_actions(rng, venv.hands[:, AGENT])
+            obs, rewards, dones, infos = venv.step(actions)
+            shared_obs, shared_rewards, shared_dones, shared_infos = shared.step(actions)
+            assert np.array_equal(obs, shared_obs)
+            assert np.array_equal(rewards, shared_rewards)
+            assert np.array_equal(dones, shared_dones)
+            for info, shared_info in zip(infos, shared_infos):
+                assert info.get("reason") == shared_info.get("reason")
+                if "terminal_observation" in info:
+                    assert np.array_equal(info["terminal_observation"], shared_info["terminal_observation"])
+    finally:
+        shared.close()
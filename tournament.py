@@ -0,0 +1,206 @@
+# Round-robin tournament between the shipped models and the heuristic opponents
+# Every pairing plays the same deals from both seats, results are cached per pairing
+# so a new checkpoint only plays its own pairings, then everyone gets a Bradley-Terry rating
+import hashlib
+import itertools
+import json
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from GoFishEnv import ENV_VERSION, spawn_seeds
+from GoFishVecEnv import GoFishVecEnv
+from GoFishOpponents import SwappedGames, make_opponent
+from GoFishPolicy import policy_path
+
+# === Config ===
+MODELS = ["GoFish_Model_easy", "GoFish_Model_medium", "GoFish_Model_hard"]
+HEURISTICS = ["random", "greedy", "explore", "memory"]
+GAMES_PER_SEAT = 1000  # Each pairing plays this many deals with each player in the agent seat
+SEED = 0  # Base seed, every pairing plays the same deals
+MAX_STEPS_PER_GAME = 500  # Games the env truncates are skipped
+MAX_STALLED_STEPS = 50  # Or that make no progress this many steps in a row
+BATCH_SIZE = 256  # Games played in lockstep per task
+NUM_WORKERS = os.cpu_count() or 1
+CACHE_PATH = "tournament_cache.json"
+
+# Players loaded so far in this process, by name
+players = {}
+
+
+# Models play through the ppo opponent, sampling their asks like evaluate.py does
+def get_player(name):
+    if name not in players:
+        if name in HEURISTICS:
+            players[name] = make_opponent(name)
+        else:
+            players[name] = make_opponent("ppo", model=name, deterministic=False)
+
+            # Exported .npz policies never import torch, a .zip gets one torch thread per process
+            # since the pool already uses every core
+            if policy_path(name).endswith(".zip"):
+                import torch
+                torch.set_num_threads(1)
+    return players[name]
+
+
+# What a player's results are cached under, models by the hash of the file load_policy reads for them
+def player_key(name):
+    if name in HEURISTICS:
+        return f"heuristic:{name}"
+    with open(policy_path(name), "rb") as f:
+        return "model:" + hashlib.sha256(f.read()).hexdigest()
+
+
+def pairing_key(key_a, key_b):
+    return (f"{key_a} vs {key_b} | env {ENV_VERSION} | seed {SEED} games 0-{GAMES_PER_SEAT}"
+            f" | truncate {MAX_STEPS_PER_GAME}/{MAX_STALLED_STEPS}")
+
+
+def load_cache(path=CACHE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_cache(cache, path=CACHE_PATH):
+    # Write then rename so an interrupted run never leaves half a file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Play agent_name in the agent seat against opponent_name on every seed
+# Returns [agent wins, opponent wins, ties, skipped]
+def play_seat(agent_name, opponent_name, game_seeds):
+    agent = get_player(agent_name)
+    env = GoFishVecEnv(min(BATCH_SIZE, len(game_seeds)), opponent=get_player(opponent_name),
+                       max_steps=MAX_STEPS_PER_GAME, max_stalled_steps=MAX_STALLED_STEPS)
+    seat = SwappedGames(env)
+    results = [0, 0, 0, 0]
+
+    slot_games = np.full(env.num_envs, -1, dtype=np.int64)
+    started = env.num_envs
+    env.reseed_games(np.arange(started), game_seeds[:started])
+    slot_games[:] = np.arange(started)
+
+    actions = np.zeros(env.num_envs, dtype=np.int64)
+    while (slot_games >= 0).any():
+        active = np.flatnonzero(slot_games >= 0)
+        actions[active] = agent.act(seat, active)
+        _, _, dones, infos = env.step(actions)
+
+        for i in active:
+            if not dones[i]:
+                continue
+            if infos[i]["TimeLimit.truncated"]:
+                results[3] += 1
+            else:
+                agent_sets, opponent_sets = env.observed_set_counts(infos[i]["terminal_observation"])
+                results[0 if agent_sets > opponent_sets else 1 if agent_sets < opponent_sets else 2] += 1
+
+            if started < len(game_seeds):
+                env.reseed_games(np.array([i]), [game_seeds[started]])
+                slot_games[i] = started
+                started += 1
+            else:
+                slot_games[i] = -1
+    return results
+
+
+# One seat of one pairing, results are returned from player_a's side
+def play_task(task):
+    player_a, player_b, a_is_agent = task
+    game_seeds = spawn_seeds(SEED, GAMES_PER_SEAT)
+    if a_is_agent:
+        return play_seat(player_a, player_b, game_seeds)
+    b_wins, a_wins, ties, skipped = play_seat(player_b, player_a, game_seeds)
+    return [a_wins, b_wins, ties, skipped]
+
+
+# Bradley-Terry strengths fitted by minorization-maximization, reported on the Elo scale
+# around 1500, every pairing gets one virtual tie so unbeaten players keep a finite rating
+def bradley_terry(names, results, iterations=10_000, tolerance=1e-10):
+    index = {name: i for i, name in enumerate(names)}
+    scores = np.zeros((len(names), len(names)))
+    for (player_a, player_b), (wins, losses, ties, _) in results.items():
+        a, b = index[player_a], index[player_b]
+        scores[a, b] += wins + ties / 2 + 0.5
+        scores[b, a] += losses + ties / 2 + 0.5
+
+    games = scores + scores.T
+    strength = np.ones(len(names))
+    for _ in range(iterations):
+        updated = scores.sum(axis=1) / (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        updated /= np.exp(np.log(updated).mean())
+        converged = np.abs(updated - strength).max() < tolerance
+        strength = updated
+        if converged:
+            break
+    return 1500 + 400 * np.log10(strength)
+
+
+def run_tournament(names, num_workers=NUM_WORKERS, cache_path=CACHE_PATH):
+    keys = {name: player_key(name) for name in names}
+    cache = load_cache(cache_path)
+
+    # Pairings are stored with their keys in sorted order, so the cache doesn't depend on names
+    results = {}
+    tasks = {}
+    for player_a, player_b in itertools.combinations(names, 2):
+        if keys[player_a] > keys[player_b]:
+            player_a, player_b = player_b, player_a
+        key = pairing_key(keys[player_a], keys[player_b])
+        if key in cache:
+            results[(player_a, player_b)] = cache[key]
+        else:
+            tasks[(player_a, player_b)] = key
+    print(f"{len(results)} pairings cached, {len(tasks)} to play")
+
+    if tasks:
+        method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(num_workers, mp_context=mp.get_context(method)) as pool:
+            futures = {pool.submit(play_task, pairing + (a_is_agent,)): pairing
+                       for pairing in tasks for a_is_agent in (True, False)}
+            seats = {pairing: [] for pairing in tasks}
+            for future in as_completed(futures):
+                pairing = futures[future]
+                seats[pairing].append(future.result())
+                if len(seats[pairing]) < 2:
+                    continue
+
+                # Both seats done, cache right away so an interrupted run keeps its progress
+                results[pairing] = [int(a + b) for a, b in zip(*seats[pairing])]
+                cache[tasks[pairing]] = results[pairing]
+                save_cache(cache, cache_path)
+                wins, losses, ties, skipped = results[pairing]
+                print(f"{pairing[0]} vs {pairing[1]}: {wins}-{losses}-{ties} ({skipped} skipped)")
+    return results
+
+
+if __name__ == "__main__":
+    start_time = time.perf_counter()
+    names = MODELS + HEURISTICS
+    results = run_tournament(names)
+    ratings = bradley_terry(names, results)
+
+    # Score counts ties as half, skipped games don't count
+    scored = {name: [0.0, 0] for name in names}
+    for (player_a, player_b), (wins, losses, ties, _) in results.items():
+        scored[player_a][0] += wins + ties / 2
+        scored[player_b][0] += losses + ties / 2
+        scored[player_a][1] += wins + losses + ties
+        scored[player_b][1] += wins + losses + ties
+
+    # === Final Report ===
+    print("\n=== Tournament Ratings ===")
+    print(f"{'Player':<22}{'Elo':>8}{'Score':>9}{'Games':>8}")
+    for i in np.argsort(-ratings):
+        name = names[i]
+        score, played = scored[name]
+        print(f"{name:<22}{ratings[i]:>8.0f}{score / max(played, 1):>9.1%}{played:>8}")
+    print(f"\nFinished in {time.perf_counter() - start_time:.1f}s")